@@ -6,25 +6,33 @@
 """Contains common helpers for GN action()s."""
 
 import collections
+import concurrent.futures
 import contextlib
 import filecmp
 import fnmatch
+import functools
+import io
 import json
+import math
 import os
 import pipes
 import re
 import shutil
 import stat
+import struct
 import subprocess
 import sys
 import tempfile
+import threading
 import zipfile
+import zlib
 import optparse
 
 # Any new non-system import must be added to:
 
 # Some clients do not add //build/scripts/util to PYTHONPATH.
 from . import md5_check  # pylint: disable=relative-import
+from . import zip_cache  # pylint: disable=relative-import
 
 sys.path.append(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir))
 import gn_helpers
@@ -40,6 +48,32 @@ DIR_SOURCE_ROOT = os.environ.get(
 HERMETIC_TIMESTAMP = (2001, 1, 1, 0, 0, 0)
 _HERMETIC_FILE_ATTR = (0o644 << 16)
 
+# Archives with fewer regular files than this are extracted on one thread,
+# where opening extra ZipFile handles would cost more than it saves.
+_PARALLEL_EXTRACT_MIN_FILES = 64
+_EXTRACT_BUFFER_SIZE = 1024 * 1024
+
+# Entries up to this size are written with ZipFile.writestr(), which takes a
+# deflate level. Larger ones are streamed through ZipFile.open() instead.
+_WRITESTR_MAX_SIZE = 64 * 1024 * 1024
+
+# Payloads in these formats are already compressed, so deflating them again
+# costs time without making the archive noticeably smaller.
+_INCOMPRESSIBLE_EXTENSIONS = frozenset([
+    '.7z', '.aar', '.apk', '.br', '.bz2', '.gz', '.hap', '.jar', '.jpeg',
+    '.jpg', '.mp3', '.mp4', '.png', '.webp', '.xz', '.zip', '.zst'
+])
+
+# The zip format does not record which deflate level an entry was written
+# with, so zip_dir(incremental=True) keeps it in a file next to the output.
+_COMPRESS_LEVEL_SUFFIX = '.compress_level'
+
+# _copy_zip_entry_raw() writes through zipfile internals (_writecheck,
+# start_dir, NameToInfo, _FH_*) whose layout has only been checked on these
+# Python versions, inclusive. Elsewhere, including Python 3.13 and later,
+# incremental zips rewrite every entry.
+_RAW_COPY_PYTHON_VERSIONS = ((3, 6), (3, 12))
+
 
 @contextlib.contextmanager
 def temp_dir():
@@ -280,61 +314,255 @@ def _check_zip_path(name):
         raise Exception('Absolute zip path: %s' % name)
 
 
-def _is_symlink(zip_file, name):
-    zi = zip_file.getinfo(name)
-
+def _is_symlink(zip_info):
     # The two high-order bytes of ZipInfo.external_attr represent
     # UNIX permissions and file type bits.
-    return stat.S_ISLNK(zi.external_attr >> 16)
+    return stat.S_ISLNK(zip_info.external_attr >> 16)
+
+
+def _extract_entries(zip_file, infos, path, replace_existing, open_lock):
+    """Extracts regular file |infos| of |zip_file| below |path|.
+
+    Several calls may share |zip_file| from different threads. zipfile
+    reference-counts its file handle without locking, so opening and closing
+    entries is serialized through |open_lock|; reading and decompressing run
+    concurrently. Parent directories must already exist.
+    """
+    for info in infos:
+        dest = os.path.join(path, info.filename)
+        if replace_existing and os.path.lexists(dest):
+            os.unlink(dest)
+        with open_lock:
+            src = zip_file.open(info)
+        try:
+            with open(dest, 'wb') as dst:
+                shutil.copyfileobj(src, dst, _EXTRACT_BUFFER_SIZE)
+        finally:
+            with open_lock:
+                src.close()
+
+
+def _zip_entry_equals_file(zip_file, info, path):
+    """Returns whether entry |info| of |zip_file| holds the bytes of |path|."""
+    with zip_file.open(info) as src, open(path, 'rb') as f:
+        while True:
+            expected = src.read(_EXTRACT_BUFFER_SIZE)
+            if not expected:
+                return not f.read(1)
+            if f.read(len(expected)) != expected:
+                return False
+
+
+def _link_or_copy(src, dest):
+    if os.path.lexists(dest):
+        os.unlink(dest)
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copyfile(src, dest)
 
 
 def extract_all(zip_path,
                 path=None,
                 no_clobber=True,
                 pattern=None,
-                predicate=None):
+                predicate=None,
+                jobs=None,
+                hardlink_duplicates=False):
+    """Extracts files from |zip_path| into |path|.
+
+    Args:
+      zip_path: Path of the zip file to extract.
+      path: Destination directory. Defaults to the current directory.
+      no_clobber: Whether to fail when a destination file already exists.
+      pattern: Optional glob that entry names must match.
+      predicate: Optional function that returns whether to extract an entry.
+      jobs: Number of threads extracting regular files. They share the
+          ZipFile from zip_cache. Defaults to the CPU count for large archives.
+      hardlink_duplicates: Whether entries with identical content are written
+          once and hardlinked to their other destinations. Entries with the
+          same CRC and size are compared byte for byte before linking. Only
+          safe when the extracted files are not modified in place afterwards.
+    Returns:
+      The list of extracted paths, in archive order.
+    """
     if path is None:
         path = os.getcwd()
     elif not os.path.exists(path):
         make_directory(path)
 
-    if not zipfile.is_zipfile(zip_path):
+    try:
+        z = zip_cache.open_zip(zip_path)
+    except zipfile.BadZipFile:
         raise Exception('Invalid zip file: %s' % zip_path)
 
     extracted = []
-    with zipfile.ZipFile(zip_path) as z:
-        for name in z.namelist():
-            if name.endswith('/'):
-                make_directory(os.path.join(path, name))
+    dirs = set()
+    files = []
+    symlinks = []
+    for info in z.infolist():
+        name = info.filename
+        if name.endswith('/'):
+            dirs.add(os.path.join(path, name))
+            continue
+        if pattern is not None:
+            if not fnmatch.fnmatch(name, pattern):
                 continue
-            if pattern is not None:
-                if not fnmatch.fnmatch(name, pattern):
-                    continue
-            if predicate and not predicate(name):
+        if predicate and not predicate(name):
+            continue
+        _check_zip_path(name)
+        output_path = os.path.join(path, name)
+        if no_clobber:
+            if os.path.exists(output_path):
+                raise Exception('Path already exists from zip: %s %s %s' %
+                                (zip_path, name, output_path))
+        dirs.add(os.path.dirname(output_path))
+        extracted.append(output_path)
+        if _is_symlink(info):
+            symlinks.append((z.read(info), output_path))
+        else:
+            files.append(info)
+
+    for dir_path in sorted(dirs):
+        make_directory(dir_path)
+
+    duplicates = []
+    if hardlink_duplicates:
+        first_by_content = {}
+        unique_files = []
+        for info in files:
+            # ijar creates zips with null CRCs, which can't identify content.
+            if not info.CRC and info.file_size:
+                unique_files.append(info)
                 continue
-            _check_zip_path(name)
-            if no_clobber:
-                output_path = os.path.join(path, name)
-                if os.path.exists(output_path):
-                    raise Exception('Path already exists from zip: %s %s %s' %
-                                    (zip_path, name, output_path))
-            if _is_symlink(z, name):
-                dest = os.path.join(path, name)
-                make_directory(os.path.dirname(dest))
-                os.symlink(z.read(name), dest)
-                extracted.append(dest)
+            key = (info.CRC, info.file_size)
+            if key in first_by_content:
+                duplicates.append((first_by_content[key], info))
             else:
-                z.extract(name, path)
-                extracted.append(os.path.join(path, name))
+                first_by_content[key] = info
+                unique_files.append(info)
+        files = unique_files
+
+    if jobs is None:
+        jobs = 1
+        if len(files) >= _PARALLEL_EXTRACT_MIN_FILES:
+            jobs = os.cpu_count() or 1
+    jobs = max(1, min(jobs, len(files)))
+    open_lock = threading.Lock()
+    if jobs == 1:
+        _extract_entries(z, files, path, hardlink_duplicates, open_lock)
+    else:
+        with concurrent.futures.ThreadPoolExecutor(jobs) as pool:
+            chunks = [files[i::jobs] for i in range(jobs)]
+            for _ in pool.map(
+                    lambda chunk: _extract_entries(z, chunk, path,
+                                                   hardlink_duplicates,
+                                                   open_lock),
+                    chunks):
+                pass
+
+    for src_info, info in duplicates:
+        src_path = os.path.join(path, src_info.filename)
+        # Equal CRC and size can still be different content.
+        if _zip_entry_equals_file(z, info, src_path):
+            _link_or_copy(src_path, os.path.join(path, info.filename))
+        else:
+            _extract_entries(z, [info], path, True, open_lock)
+
+    for target, output_path in symlinks:
+        os.symlink(target, output_path)
 
     return extracted
 
 
+class CompressionPolicy(object):
+    """Decides per entry whether deflating it is worth the time.
+
+    Entries whose extension names an already-compressed format are stored.
+    For everything else the first |sample_size| bytes are sampled and the
+    entry is deflated only when the sample's byte entropy is below
+    |max_entropy| bits per byte.
+
+    Instances can be passed as |compress_policy| to do_zip() and zip_dir().
+    """
+    def __init__(self,
+                 level=6,
+                 sample_size=64 * 1024,
+                 max_entropy=7.5,
+                 incompressible_extensions=_INCOMPRESSIBLE_EXTENSIONS):
+        self.level = level
+        self.sample_size = sample_size
+        self.max_entropy = max_entropy
+        self.incompressible_extensions = frozenset(incompressible_extensions)
+
+    def __call__(self, zip_path, fs_path):
+        """Returns whether the entry |zip_path| read from |fs_path| should be
+        deflated."""
+        ext = os.path.splitext(zip_path)[1].lower()
+        if ext in self.incompressible_extensions:
+            return False
+        if os.path.islink(fs_path):
+            return False
+        with open(fs_path, 'rb') as f:
+            sample = f.read(self.sample_size)
+        return _byte_entropy(sample) < self.max_entropy
+
+
+def _byte_entropy(data):
+    """Returns the Shannon entropy of |data| in bits per byte."""
+    if not data:
+        return 0.0
+    total = float(len(data))
+    return -sum(count / total * math.log(count / total, 2)
+                for count in collections.Counter(data).values())
+
+
+def _write_hermetic_entry(zip_file,
+                          zip_path,
+                          src,
+                          size,
+                          external_attr,
+                          compress=None,
+                          compress_level=None):
+    """Streams |size| bytes from the file object |src| into |zip_file|.
+
+    The size is known up front, so zipfile switches to Zip64 records by
+    itself when the entry needs them, without buffering the contents.
+
+    Only ZipFile.writestr() takes a deflate level before Python 3.13, so
+    |compress_level| is ignored for entries larger than _WRITESTR_MAX_SIZE
+    on older versions.
+    """
+    zipinfo = zipfile.ZipInfo(filename=zip_path, date_time=HERMETIC_TIMESTAMP)
+    zipinfo.external_attr = external_attr
+    zipinfo.file_size = size
+
+    # zipfile will deflate even when it makes the file bigger. To avoid
+    # growing files, disable compression at an arbitrary cut off point.
+    if size < 16:
+        compress = False
+
+    # None converts to ZIP_STORED, when passed explicitly rather than the
+    # default passed to the ZipFile constructor.
+    zipinfo.compress_type = zip_file.compression
+    if compress is not None:
+        zipinfo.compress_type = (zipfile.ZIP_DEFLATED
+                                 if compress else zipfile.ZIP_STORED)
+    if compress_level is not None and size <= _WRITESTR_MAX_SIZE:
+        zip_file.writestr(zipinfo, src.read(), compresslevel=compress_level)
+        return
+    if compress_level is not None and hasattr(zipinfo, 'compress_level'):
+        zipinfo.compress_level = compress_level
+    with zip_file.open(zipinfo, 'w') as dst:
+        shutil.copyfileobj(src, dst, _EXTRACT_BUFFER_SIZE)
+
+
 def add_to_zip_hermetic(zip_file,
                         zip_path,
                         src_path=None,
                         data=None,
-                        compress=None):
+                        compress=None,
+                        compress_level=None):
     """Adds a file to the given ZipFile with a hard-coded modified time.
 
     Args:
@@ -344,6 +572,8 @@ def add_to_zip_hermetic(zip_file,
       data: File data as a string.
       compress: Whether to enable compression. Default is taken from ZipFile
           constructor.
+      compress_level: Deflate level (0-9) used when compressing. Default is
+          taken from ZipFile constructor.
     """
     assert (src_path is None) != (data is None), (
         '|src_path| and |data| are mutually exclusive.')
@@ -357,36 +587,180 @@ def add_to_zip_hermetic(zip_file,
         zip_file.writestr(zipinfo, os.readlink(src_path))
         return
 
-    # we want to use _HERMETIC_FILE_ATTR, so manually set
-    # the few attr bits we care about.
-    if src_path:
-        st = os.stat(src_path)
-        for mode in (stat.S_IXUSR, stat.S_IXGRP, stat.S_IXOTH):
-            if st.st_mode & mode:
-                zipinfo.external_attr |= mode << 16
-
     if src_path:
+        # Stream the file rather than reading it into memory, so entries
+        # larger than RAM (or 4 GiB) can be added.
         with open(src_path, 'rb') as f:
-            data = f.read()
+            _write_hermetic_entry(zip_file,
+                                  zip_path,
+                                  f,
+                                  os.fstat(f.fileno()).st_size,
+                                  _hermetic_file_attr(src_path),
+                                  compress=compress,
+                                  compress_level=compress_level)
+        return
 
-    # zipfile will deflate even when it makes the file bigger. To avoid
-    # growing files, disable compression at an arbitrary cut off point.
-    if len(data) < 16:
-        compress = False
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    _write_hermetic_entry(zip_file,
+                          zip_path,
+                          io.BytesIO(data),
+                          len(data),
+                          zipinfo.external_attr,
+                          compress=compress,
+                          compress_level=compress_level)
 
-    # None converts to ZIP_STORED, when passed explicitly rather than the
-    # default passed to the ZipFile constructor.
-    compress_type = zip_file.compression
-    if compress is not None:
-        compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
-    zip_file.writestr(zipinfo, data, compress_type)
+
+def _hermetic_file_attr(src_path):
+    """Returns the external_attr add_to_zip_hermetic() gives a regular file.
+
+    We want to use _HERMETIC_FILE_ATTR, so only the few attr bits we care
+    about are taken from |src_path|.
+    """
+    attr = _HERMETIC_FILE_ATTR
+    st = os.stat(src_path)
+    for mode in (stat.S_IXUSR, stat.S_IXGRP, stat.S_IXOTH):
+        if st.st_mode & mode:
+            attr |= mode << 16
+    return attr
+
+
+def _file_crc32(path):
+    crc = 0
+    with open(path, 'rb') as f:
+        while True:
+            buf = f.read(_EXTRACT_BUFFER_SIZE)
+            if not buf:
+                break
+            crc = zlib.crc32(buf, crc)
+    return crc
+
+
+def _is_zip_entry_unchanged(zip_info, fs_path, compress_type, compress_level,
+                            base_compress_level):
+    """Returns whether |zip_info| holds what add_to_zip_hermetic() would write
+    for |fs_path| with |compress_type| and |compress_level|.
+
+    |base_compress_level| is the level the archive of |zip_info| was written
+    with, None meaning the zlib default.
+    """
+    if os.path.islink(fs_path):
+        return False
+    if zip_info.date_time != HERMETIC_TIMESTAMP:
+        return False
+    if zip_info.file_size != os.path.getsize(fs_path):
+        return False
+    # Tiny files are always stored, see add_to_zip_hermetic().
+    if zip_info.file_size < 16:
+        compress_type = zipfile.ZIP_STORED
+    if zip_info.compress_type != compress_type:
+        return False
+    if (compress_type == zipfile.ZIP_DEFLATED
+            and compress_level != base_compress_level):
+        return False
+    if zip_info.external_attr != _hermetic_file_attr(fs_path):
+        return False
+    return zip_info.CRC == _file_crc32(fs_path)
+
+
+class _HashingWriter(object):
+    """Write-only file wrapper that feeds every written byte to |hash_obj|.
+
+    It refuses to seek, so ZipFile streams each entry followed by a data
+    descriptor instead of seeking back to patch its local header. That keeps
+    the digest equal to the hash of the file that ends up on disk.
+    """
+    def __init__(self, fileobj, hash_obj):
+        self._fileobj = fileobj
+        self._hash_obj = hash_obj
+        self._offset = 0
+
+    def write(self, data):
+        self._hash_obj.update(data)
+        self._fileobj.write(data)
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def seek(self, *_):
+        raise io.UnsupportedOperation('seek')
+
+    def flush(self):
+        self._fileobj.flush()
+
+
+def _can_copy_zip_entry_raw(zip_file):
+    """Returns whether _copy_zip_entry_raw() can write into |zip_file|.
+
+    Otherwise entries have to be compressed again through the public API.
+    """
+    if not (_RAW_COPY_PYTHON_VERSIONS[0] <= sys.version_info[:2] <=
+            _RAW_COPY_PYTHON_VERSIONS[1]):
+        return False
+    module_names = ('_FH_FILENAME_LENGTH', '_FH_EXTRA_FIELD_LENGTH',
+                    '_MASK_USE_DATA_DESCRIPTOR', '_DD_SIGNATURE',
+                    'structFileHeader', 'sizeFileHeader')
+    instance_names = ('_writecheck', '_seekable', 'start_dir', 'fp',
+                      'filelist', 'NameToInfo')
+    return (all(hasattr(zipfile, n) for n in module_names)
+            and all(hasattr(zip_file, n) for n in instance_names))
+
+
+def _copy_zip_entry_raw(src_fp, src_info, zip_file):
+    """Copies |src_info| from the archive opened as |src_fp| into |zip_file|
+    without decompressing and recompressing its payload.
+
+    Only call this when _can_copy_zip_entry_raw(zip_file) is True.
+    """
+    src_fp.seek(src_info.header_offset)
+    fheader = struct.unpack(zipfile.structFileHeader,
+                            src_fp.read(zipfile.sizeFileHeader))
+    src_fp.seek(
+        fheader[zipfile._FH_FILENAME_LENGTH] +
+        fheader[zipfile._FH_EXTRA_FIELD_LENGTH], os.SEEK_CUR)
+
+    zipinfo = zipfile.ZipInfo(filename=src_info.filename,
+                              date_time=src_info.date_time)
+    zipinfo.external_attr = src_info.external_attr
+    zipinfo.compress_type = src_info.compress_type
+    zipinfo.CRC = src_info.CRC
+    zipinfo.compress_size = src_info.compress_size
+    zipinfo.file_size = src_info.file_size
+    # Match the header ZipFile.writestr() would have produced.
+    zip64 = zipinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT
+    if not zip_file._seekable:
+        zipinfo.flag_bits |= zipfile._MASK_USE_DATA_DESCRIPTOR
+
+    zip_file._writecheck(zipinfo)
+    zipinfo.header_offset = zip_file.fp.tell()
+    zip_file.fp.write(zipinfo.FileHeader(zip64))
+    remaining = zipinfo.compress_size
+    while remaining:
+        buf = src_fp.read(min(remaining, _EXTRACT_BUFFER_SIZE))
+        if not buf:
+            raise Exception('Truncated zip entry: %s' % src_info.filename)
+        zip_file.fp.write(buf)
+        remaining -= len(buf)
+    if zipinfo.flag_bits & zipfile._MASK_USE_DATA_DESCRIPTOR:
+        fmt = '<LLQQ' if zip64 else '<LLLL'
+        zip_file.fp.write(
+            struct.pack(fmt, zipfile._DD_SIGNATURE, zipinfo.CRC,
+                        zipinfo.compress_size, zipinfo.file_size))
+    zip_file.start_dir = zip_file.fp.tell()
+    zip_file.filelist.append(zipinfo)
+    zip_file.NameToInfo[zipinfo.filename] = zipinfo
 
 
 def do_zip(inputs,
            output,
            base_dir=None,
            compress_fn=None,
-           zip_prefix_path=None):
+           zip_prefix_path=None,
+           compress_policy=None,
+           base_zip=None,
+           base_compress_level=None):
     """Creates a zip file from a list of files.
 
     Args:
@@ -396,7 +770,17 @@ def do_zip(inputs,
       compress_fn: Applied to each input to determine whether or not to compress.
           By default, items will be |zipfile.ZIP_STORED|.
       zip_prefix_path: Path prepended to file path in zip file.
+      compress_policy: A CompressionPolicy deciding per entry whether to
+          compress based on its content. Mutually exclusive with |compress_fn|.
+      base_zip: Path of a previous version of |output|. Entries whose name,
+          size, CRC, attributes and compression are unchanged are copied from
+          it verbatim instead of being read and compressed again, when the
+          running zipfile module supports it.
+      base_compress_level: Deflate level |base_zip| was written with, None
+          for the zlib default.
     """
+    assert not (compress_fn and compress_policy), (
+        '|compress_fn| and |compress_policy| are mutually exclusive.')
     input_tuples = []
     for tup in inputs:
         if isinstance(tup, str):
@@ -405,48 +789,124 @@ def do_zip(inputs,
 
     # Sort by zip path to ensure stable zip ordering.
     input_tuples.sort(key=lambda tup: tup[0])
-    with zipfile.ZipFile(output, 'w') as outfile:
+    base_infos = {}
+    with contextlib.ExitStack() as stack:
+        outfile = stack.enter_context(zipfile.ZipFile(output, 'w', allowZip64=True))
+        if base_zip and _can_copy_zip_entry_raw(outfile):
+            base_file = zip_cache.open_zip(base_zip)
+            base_infos = {info.filename: info for info in base_file.infolist()}
+            base_fp = stack.enter_context(open(base_zip, 'rb'))
         for zip_path, fs_path in input_tuples:
             if zip_prefix_path:
                 zip_path = os.path.join(zip_prefix_path, zip_path)
             compress = compress_fn(zip_path) if compress_fn else None
+            compress_level = None
+            if compress_policy:
+                compress = compress_policy(zip_path, fs_path)
+                compress_level = compress_policy.level
+            base_info = base_infos.get(zip_path)
+            if base_info:
+                compress_type = outfile.compression
+                if compress is not None:
+                    compress_type = (zipfile.ZIP_DEFLATED
+                                     if compress else zipfile.ZIP_STORED)
+                if _is_zip_entry_unchanged(base_info, fs_path, compress_type,
+                                           compress_level,
+                                           base_compress_level):
+                    _copy_zip_entry_raw(base_fp, base_info, outfile)
+                    continue
             add_to_zip_hermetic(outfile,
                                 zip_path,
                                 src_path=fs_path,
-                                compress=compress)
-
-
-def zip_dir(output, base_dir, compress_fn=None, zip_prefix_path=None):
-    """Creates a zip file from a directory."""
+                                compress=compress,
+                                compress_level=compress_level)
+
+
+def zip_dir(output,
+            base_dir,
+            compress_fn=None,
+            zip_prefix_path=None,
+            compress_policy=None,
+            incremental=False,
+            hash_obj=None):
+    """Creates a zip file from a directory.
+
+    When |incremental| is True and |output| already is a zip file, entries
+    that did not change are copied from it rather than compressed again. The
+    deflate level is then recorded in |output|.compress_level, and a previous
+    |output| without that file is not reused.
+
+    When |hash_obj| (e.g. a hashlib object) is given, it is updated with the
+    archive bytes as they are written, so the digest of |output| is known
+    without reading it back.
+    """
     inputs = []
     for root, _, files in os.walk(base_dir):
         for f in files:
             inputs.append(os.path.join(root, f))
 
+    level_path = output + _COMPRESS_LEVEL_SUFFIX
+    base_zip = None
+    base_compress_level = None
+    if (incremental and os.path.exists(level_path)
+            and os.path.exists(output) and zipfile.is_zipfile(output)):
+        with open(level_path, 'r') as f:
+            level = f.read().strip()
+        base_zip = output
+        base_compress_level = int(level) if level else None
+    # Removed first, so it never describes an archive it was not written for.
+    if os.path.exists(level_path):
+        os.unlink(level_path)
+
+    compress_level = compress_policy.level if compress_policy else None
     with atomic_output(output) as f:
+        if hash_obj is not None:
+            f = _HashingWriter(f, hash_obj)
         do_zip(inputs,
                f,
                base_dir,
                compress_fn=compress_fn,
-               zip_prefix_path=zip_prefix_path)
+               zip_prefix_path=zip_prefix_path,
+               compress_policy=compress_policy,
+               base_zip=base_zip,
+               base_compress_level=base_compress_level)
+    if incremental:
+        with open(level_path, 'w') as f:
+            f.write('' if compress_level is None else str(compress_level))
+
+
+@functools.lru_cache(maxsize=64)
+def _compile_glob_tuple(filters):
+    if not filters:
+        return lambda path: False
+    regex = re.compile('|'.join(
+        '(?:{})'.format(fnmatch.translate(f)) for f in filters))
+    return lambda path: regex.match(path) is not None
+
+
+def compile_globs(filters):
+    """Returns a function that tells whether a path matches any of |filters|.
+
+    All glob patterns are folded into a single regular expression, so the cost
+    of a lookup does not grow with the number of patterns.
+    """
+    return _compile_glob_tuple(tuple(filters or ()))
 
 
 def matches_glob(path, filters):
     """Returns whether the given path matches any of the given glob patterns."""
-    return filters and any(fnmatch.fnmatch(path, f) for f in filters)
+    return bool(filters) and compile_globs(filters)(path)
 
 
-def _strip_dst_name(dst_name, options):
+def _create_strip_matcher(options):
+    """Returns a function telling whether merge_zips() should drop a path."""
     # Strip specific directories and file if options is not None
+    patterns = []
     if options and options.stripFile:
-        for f in options.stripFile:
-            if fnmatch.fnmatch(dst_name, '*/' + f):
-                return True
+        patterns.extend('*/' + f for f in options.stripFile)
     if options and options.stripDir:
-        for d in options.stripDir:
-            if fnmatch.fnmatch(dst_name, d + '/*'):
-                return True
-    return False
+        patterns.extend(d + '/*' for d in options.stripDir)
+    return compile_globs(patterns)
 
 
 def merge_zips(output, input_zips, path_transform=None, merge_args=None):
@@ -472,6 +932,7 @@ def merge_zips(output, input_zips, path_transform=None, merge_args=None):
         options, _ = parser.parse_args(args)
 
     path_transform = path_transform or (lambda p: p)
+    is_stripped = _create_strip_matcher(options)
     added_names = set()
 
     output_is_already_open = not isinstance(output, str)
@@ -479,30 +940,34 @@ def merge_zips(output, input_zips, path_transform=None, merge_args=None):
         assert isinstance(output, zipfile.ZipFile)
         out_zip = output
     else:
-        out_zip = zipfile.ZipFile(output, 'w')
+        out_zip = zipfile.ZipFile(output, 'w', allowZip64=True)
 
     try:
         for in_file in input_zips:
-            with zipfile.ZipFile(in_file, 'r') as in_zip:
-                # ijar creates zips with null CRCs.
-                in_zip._expected_crc = None
-                for info in in_zip.infolist():
-                    # Ignore directories.
-                    if info.filename[-1] == '/':
-                        continue
-                    dst_name = path_transform(info.filename)
-                    if not dst_name:
-                        continue
-                    if _strip_dst_name(dst_name, options):
-                        continue
-                    already_added = dst_name in added_names
-                    if not already_added:
-                        add_to_zip_hermetic(
+            in_zip = zip_cache.open_zip(in_file)
+            # ijar creates zips with null CRCs.
+            in_zip._expected_crc = None
+            for info in in_zip.infolist():
+                # Ignore directories.
+                if info.filename[-1] == '/':
+                    continue
+                dst_name = path_transform(info.filename)
+                if not dst_name:
+                    continue
+                if is_stripped(dst_name):
+                    continue
+                already_added = dst_name in added_names
+                if not already_added:
+                    _check_zip_path(dst_name)
+                    with in_zip.open(info) as src:
+                        _write_hermetic_entry(
                             out_zip,
                             dst_name,
-                            data=in_zip.read(info),
+                            src,
+                            info.file_size,
+                            _HERMETIC_FILE_ATTR,
                             compress=info.compress_type != zipfile.ZIP_STORED)
-                        added_names.add(dst_name)
+                    added_names.add(dst_name)
     finally:
         if not output_is_already_open:
             out_zip.close()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026 Huawei Device Co., Ltd.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import io
+import os
+import struct
+import sys
+import tempfile
+import unittest
+import zipfile
+import zlib
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from scripts.util import build_utils  # noqa: E402
+
+# Tag of the Zip64 extended information extra field.
+_ZIP64_EXTRA_TAG = 0x0001
+
+
+def _extra_tags(extra):
+    tags = []
+    while len(extra) >= 4:
+        tag, size = struct.unpack('<HH', extra[:4])
+        tags.append(tag)
+        extra = extra[4 + size:]
+    return tags
+
+
+class Zip64StreamingTest(unittest.TestCase):
+    """Entries above the Zip64 limit are streamed with Zip64 records.
+
+    Writing real 4 GiB entries is too slow for a unit test, so the limit is
+    lowered instead: zipfile reads ZIP64_LIMIT each time it writes a record.
+    """
+
+    _LIMIT = 1024
+
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._temp_dir.cleanup)
+        self._src_dir = os.path.join(self._temp_dir.name, 'src')
+        os.mkdir(self._src_dir)
+
+    def _write_source(self, name, size):
+        path = os.path.join(self._src_dir, name)
+        with open(path, 'wb') as f:
+            f.write(bytes(range(256)) * (size // 256))
+        return path
+
+    def _check_entry(self, zip_path, name, src_path):
+        with zipfile.ZipFile(zip_path) as z:
+            info = z.getinfo(name)
+            self.assertIn(_ZIP64_EXTRA_TAG, _extra_tags(info.extra))
+            with open(src_path, 'rb') as f:
+                self.assertEqual(z.read(info), f.read())
+            self.assertIsNone(z.testzip())
+
+    def test_add_to_zip_hermetic(self):
+        src_path = self._write_source('big.bin', 4 * self._LIMIT)
+        zip_path = os.path.join(self._temp_dir.name, 'out.zip')
+        with mock.patch.object(zipfile, 'ZIP64_LIMIT', self._LIMIT):
+            with zipfile.ZipFile(zip_path, 'w', allowZip64=True) as z:
+                build_utils.add_to_zip_hermetic(z,
+                                                'big.bin',
+                                                src_path=src_path,
+                                                compress=True)
+        self._check_entry(zip_path, 'big.bin', src_path)
+
+    def test_zip_dir_unseekable(self):
+        src_path = self._write_source('big.bin', 4 * self._LIMIT)
+        zip_path = os.path.join(self._temp_dir.name, 'out.zip')
+        digest = hashlib.sha256()
+        with mock.patch.object(zipfile, 'ZIP64_LIMIT', self._LIMIT):
+            build_utils.zip_dir(zip_path, self._src_dir, hash_obj=digest)
+        self._check_entry(zip_path, 'big.bin', src_path)
+        with open(zip_path, 'rb') as f:
+            self.assertEqual(digest.hexdigest(),
+                             hashlib.sha256(f.read()).hexdigest())
+
+    def test_streamed_entry_is_not_buffered(self):
+        src_path = self._write_source('big.bin', 4 * self._LIMIT)
+        zip_path = os.path.join(self._temp_dir.name, 'out.zip')
+        with mock.patch.object(zipfile, 'ZIP64_LIMIT', self._LIMIT), \
+                mock.patch.object(build_utils, '_WRITESTR_MAX_SIZE', 0), \
+                mock.patch.object(zipfile.ZipFile, 'writestr') as writestr:
+            with zipfile.ZipFile(zip_path, 'w', allowZip64=True) as z:
+                build_utils.add_to_zip_hermetic(z,
+                                                'big.bin',
+                                                src_path=src_path,
+                                                compress=True,
+                                                compress_level=9)
+        writestr.assert_not_called()
+        self._check_entry(zip_path, 'big.bin', src_path)
+
+
+class CompressLevelTest(unittest.TestCase):
+    _DATA = b''.join(b'%d\n' % i for i in range(20000))
+
+    def _compress_size(self, level):
+        out = io.BytesIO()
+        with zipfile.ZipFile(out, 'w') as z:
+            build_utils.add_to_zip_hermetic(z,
+                                            'a.txt',
+                                            data=self._DATA,
+                                            compress=True,
+                                            compress_level=level)
+        with zipfile.ZipFile(out) as z:
+            self.assertEqual(z.read('a.txt'), self._DATA)
+            return z.getinfo('a.txt').compress_size
+
+    def test_level_is_applied(self):
+        for level in (1, 9):
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+            expected = compressor.compress(self._DATA) + compressor.flush()
+            self.assertEqual(self._compress_size(level), len(expected))
+
+
+
+def _force_crc32(prefix, target):
+    """Returns |prefix| plus 4 bytes chosen so its CRC32 is |target|.
+
+    CRC32 is affine in the appended bits, so they are found by solving a
+    32x32 linear system over GF(2).
+    """
+    base = zlib.crc32(prefix + b'\0' * 4)
+    # Each row is (effect of one appended bit on the CRC, the bit itself).
+    rows = []
+    for bit in range(32):
+        suffix = (1 << bit).to_bytes(4, 'little')
+        rows.append((zlib.crc32(prefix + suffix) ^ base, 1 << bit))
+    wanted = target ^ base
+    solution = 0
+    for crc_bit in range(32):
+        mask = 1 << crc_bit
+        pivot = next(i for i, (effect, _) in enumerate(rows) if effect & mask)
+        pivot_row = rows.pop(pivot)
+        rows = [(e ^ pivot_row[0], b ^ pivot_row[1]) if e & mask else (e, b)
+                for e, b in rows]
+        if wanted & mask:
+            wanted ^= pivot_row[0]
+            solution ^= pivot_row[1]
+    return prefix + solution.to_bytes(4, 'little')
+
+
+class HardlinkDuplicatesTest(unittest.TestCase):
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._temp_dir.cleanup)
+        self._zip_path = os.path.join(self._temp_dir.name, 'in.zip')
+
+    def _extract(self, entries):
+        with zipfile.ZipFile(self._zip_path, 'w') as z:
+            for name, data in entries:
+                z.writestr(name, data)
+        out_dir = os.path.join(self._temp_dir.name, 'out')
+        build_utils.extract_all(self._zip_path,
+                                path=out_dir,
+                                hardlink_duplicates=True)
+        return out_dir
+
+    def test_identical_entries_are_linked(self):
+        out_dir = self._extract([('a', b'same data'), ('b', b'same data')])
+        self.assertTrue(
+            os.path.samefile(os.path.join(out_dir, 'a'),
+                             os.path.join(out_dir, 'b')))
+
+    def test_crc_collision_is_not_linked(self):
+        first = _force_crc32(b'first entry', 0x12345678)
+        second = _force_crc32(b'other entry', 0x12345678)
+        self.assertEqual(zlib.crc32(first), zlib.crc32(second))
+        out_dir = self._extract([('a', first), ('b', second)])
+        for name, data in (('a', first), ('b', second)):
+            with open(os.path.join(out_dir, name), 'rb') as f:
+                self.assertEqual(f.read(), data)
+
+
+if __name__ == '__main__':
+    unittest.main()
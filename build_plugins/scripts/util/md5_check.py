@@ -9,9 +9,9 @@ import hashlib
 import itertools
 import json
 import os
-import zipfile
 from .pycache import pycache_enabled
 from .pycache import pycache
+from . import zip_cache
 
 # When set and a difference is detected, a diff of what changed is printed.
 PRINT_EXPLANATIONS = int(os.environ.get('PRINT_BUILD_EXPLANATIONS', 0))
@@ -436,10 +436,9 @@ def _is_zip_file(path):
 def _extract_zip_entries(path):
     """Returns a list of (path, CRC32) of all files within |path|."""
     entries = []
-    with zipfile.ZipFile(path) as zip_file:
-        for zip_info in zip_file.infolist():
-            # Skip directories and empty files.
-            if zip_info.CRC:
-                entries.append(
-                    (zip_info.filename, zip_info.CRC + zip_info.compress_type))
+    for zip_info in zip_cache.infolist(path):
+        # Skip directories and empty files.
+        if zip_info.CRC:
+            entries.append(
+                (zip_info.filename, zip_info.CRC + zip_info.compress_type))
     return entries
@@ -21,26 +21,6 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(
 import file_utils  # noqa: E402
 from scripts.util import build_utils  # noqa: E402
 
-__MAX_BUF = 1024 * 1024
-
-
-def _gen_signature(input_file):
-    if not os.path.isfile(input_file):
-        raise Exception()
-    hash_value = ''
-    sha256obj = hashlib.sha256()
-    try:
-        with open(input_file, 'rb') as file_obj:
-            while True:
-                buf = file_obj.read(__MAX_BUF)
-                if not buf:
-                    break
-                sha256obj.update(buf)
-            hash_value = sha256obj.hexdigest()
-    except OSError as err:
-        sys.stdout.write("read file failed. {}".format(err))
-    return hash_value
-
 
 def _write_signature_file(signature_file, hash_value):
     if os.path.exists(signature_file):
@@ -68,16 +48,40 @@ def main():
     parser.add_argument('--input-dir', required=True)
     parser.add_argument('--output-zipfile', required=True)
     parser.add_argument('--signature-file', required=True)
+    parser.add_argument('--compress-level',
+                        type=int,
+                        help='deflate compressible entries at this level '
+                        '(0-9); entries are stored when omitted')
+    parser.add_argument('--incremental',
+                        action='store_true',
+                        help='reuse unchanged entries of an existing zipfile. '
+                        'The deflate level is kept in '
+                        '<output-zipfile>.compress_level. Entries are only '
+                        'reused on Python 3.6 to 3.12, since copying them '
+                        'relies on zipfile internals; other versions rewrite '
+                        'the whole zipfile')
     args = parser.parse_args()
 
-    if os.path.exists(args.output_zipfile):
+    compress_policy = None
+    if args.compress_level is not None:
+        compress_policy = build_utils.CompressionPolicy(
+            level=args.compress_level)
+
+    if os.path.exists(args.output_zipfile) and not args.incremental:
         os.remove(args.output_zipfile)
-    build_utils.zip_dir(args.output_zipfile, args.input_dir)
+    # The signature is hashed while the zip is written, so the archive is
+    # not read back.
+    sha256obj = hashlib.sha256()
+    build_utils.zip_dir(args.output_zipfile,
+                        args.input_dir,
+                        compress_policy=compress_policy,
+                        incremental=args.incremental,
+                        hash_obj=sha256obj)
     if not os.path.exists(args.output_zipfile):
         raise Exception("generate zipfile '{}' failed.".format(
             args.output_zipfile))
 
-    hash_value = _gen_signature(args.output_zipfile)
+    hash_value = sha256obj.hexdigest()
     _update_signature(args.signature_file, hash_value)
     return 0
 
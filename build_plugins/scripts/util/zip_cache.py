@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026 Huawei Device Co., Ltd.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Per-process cache of opened zip files.
+
+One action often reads the same archive several times (md5 stamping,
+extraction, merging), and every zipfile.ZipFile() parses the whole central
+directory again. Archives opened through this module are kept in a small
+LRU keyed by path and stat, so a directory is parsed once while the file
+stays unchanged.
+"""
+
+import collections
+import os
+import threading
+import zipfile
+
+# Number of archives kept open at the same time.
+_MAX_OPEN_ZIPS = 16
+
+_lock = threading.Lock()
+_open_zips = collections.OrderedDict()
+
+
+def _cache_key(path):
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def open_zip(path):
+    """Returns a read-only ZipFile for |path| that is shared with other callers.
+
+    Callers must neither close the returned ZipFile nor modify it. An evicted
+    archive is closed once its last user drops it.
+    """
+    key = _cache_key(path)
+    with _lock:
+        zip_file = _open_zips.get(key)
+        if zip_file is not None:
+            _open_zips.move_to_end(key)
+            return zip_file
+
+    zip_file = zipfile.ZipFile(path)
+    with _lock:
+        # Keep the first instance if another thread opened it meanwhile.
+        zip_file = _open_zips.setdefault(key, zip_file)
+        _open_zips.move_to_end(key)
+        while len(_open_zips) > _MAX_OPEN_ZIPS:
+            _open_zips.popitem(last=False)
+    return zip_file
+
+
+def infolist(path):
+    """Returns the ZipInfo list of |path|, parsing it only when not cached."""
+    return open_zip(path).infolist()
+
+
+def clear():
+    """Drops all cached archives."""
+    with _lock:
+        _open_zips.clear()
@@ -21,10 +21,10 @@ import subprocess
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from scripts.util.file_utils import read_json_file
-from scripts.util.build_utils import zip_dir, temp_dir
+from scripts.util.build_utils import zip_dir, temp_dir, CompressionPolicy
 
 
-def archive_unstripped_lib(unstripped_zip_file):
+def archive_unstripped_lib(unstripped_zip_file, compress_level=None):
     unstripped_lib_dirs = [
         'aosp_clang_x86_64/lib.unstripped/aosp_clang_x86_64',
         'aosp_clang_arm64_release/lib.unstripped/aosp_clang_arm64_release',
@@ -52,15 +52,21 @@ def archive_unstripped_lib(unstripped_zip_file):
                 cmd = ['rsync', '-rR', unstripped_lib, tmp_dir]
             proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding='utf-8')
             proc.communicate()
-        zip_dir(unstripped_zip_file, tmp_dir, zip_prefix_path='unstripped_lib')
+        compress_policy = None
+        if compress_level is not None:
+            compress_policy = CompressionPolicy(level=compress_level)
+        zip_dir(unstripped_zip_file, tmp_dir, zip_prefix_path='unstripped_lib',
+                compress_policy=compress_policy)
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--output-file', required=True)
+    parser.add_argument('--compress-level', type=int,
+                        help='deflate compressible libraries at this level (0-9)')
     args = parser.parse_args()
 
-    archive_unstripped_lib(args.output_file)
+    archive_unstripped_lib(args.output_file, args.compress_level)
 
 
 if __name__ == '__main__':
@@ -13,8 +13,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import re
 import fnmatch
+import hashlib
+import json
+import os
+
+from util import build_utils
+from util import java_source_utils
 
 
 def _read_file(file):
@@ -28,32 +33,24 @@ def _read_file(file):
 
 
 def parse_import_class(java_file):
-    imports = []
-    with open(java_file) as f:
-        for l in f:
-            # Strip unindented comments.
-            l = re.sub(r'^(?://.*|/?\*.*?(?:\*/\s*|$))', '', l)
-
-            match = re.match(r'import\s+(static)*\s*(.*?);', l)
-            if match:
-                imports.append(match.group(2))
-    return imports
+    return list(java_source_utils.parse_java_source(java_file).imports)
 
 
 def _get_java_source_files(java_sources_file_path):
     java_files = []
     for item in _read_file(java_sources_file_path):
-        f = item.split(' ')
-        java_files = java_files + f
+        java_files.extend(f for f in item.split(' ') if f)
     return java_files
 
 
 def _check_file_suffix(java_files):
+    checked = []
     for file in java_files:
-        if not file.endswith(".java"):
+        if file.endswith(".java"):
+            checked.append(file)
+        else:
             print("Warning: {} Is Not A Java File !".format(file))
-            java_files.remove(file)
-            java_files.remove('')
+    return checked
 
 
 def _print_in_red(msg):
@@ -75,43 +72,167 @@ def remove_ignored(names, ignored_patterns):
     return removed
 
 
-def allowlist_check(allow_list_file_path,
-                    java_sources_file_path,
-                    all_aosp_imports_file):
-    checklist = _read_file(allow_list_file_path)
-    all_aosp_imports = _read_file(all_aosp_imports_file)
-
-    java_files = _get_java_source_files(java_sources_file_path)
-    _check_file_suffix(java_files)
+class ImportIndex(object):
+    """A set of imported names, loaded once from an API list file.
+
+    Entries are fully qualified names. An entry ending in '.*' also covers
+    every name below that package, e.g. 'ohos.app.*' covers
+    'ohos.app.Context' and 'ohos.app.dispatcher.TaskDispatcher'.
+    """
+
+    def __init__(self, entries):
+        self._names = frozenset(entries)
+        # Trie of the wildcard packages, one level per name component. A
+        # node holding the None key ends a wildcard package.
+        self._packages = {}
+        for entry in self._names:
+            if entry.endswith('.*'):
+                node = self._packages
+                for part in entry[:-2].split('.'):
+                    node = node.setdefault(part, {})
+                node[None] = True
+
+    def __contains__(self, name):
+        if name in self._names:
+            return True
+        node = self._packages
+        for part in name.split('.'):
+            node = node.get(part)
+            if node is None:
+                return False
+            if None in node:
+                return True
+        return False
+
+    def filter(self, names):
+        return set(n for n in names if n in self)
+
+
+def _load_import_index(file_path):
+    return ImportIndex(line.strip() for line in _read_file(file_path)
+                       if line.strip())
+
+
+def _digest_files(paths):
+    digest = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest.update('{}\n'.format(len(data)).encode())
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class VerdictCache(object):
+    """Verdicts of the checks, kept at |path| from one build to the next.
+
+    A verdict is keyed by the digest of the source's content. All verdicts
+    are dropped once the content of any of |list_files| changes, so they
+    must name every list the checks read.
+
+    {'lists': digest of |list_files|,
+     'verdicts': {check: {source digest: [violating imports]}}}
+    """
+
+    def __init__(self, path, list_files):
+        self.path = path
+        self._lists_digest = _digest_files(list_files)
+        self._previous = {}
+        self._current = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    cache = json.load(f)
+                if cache.get('lists') == self._lists_digest:
+                    self._previous = cache['verdicts']
+            except (ValueError, KeyError):
+                pass
+
+    def find_violations(self, check, java_files, find_func):
+        """Returns {java file: sorted violating imports} for |java_files|.
+
+        |find_func| returns the violations in a collection of imports. It is
+        only called for sources whose content has no verdict for |check| yet.
+        """
+        previous = self._previous.get(check, {})
+        current = self._current.setdefault(check, {})
+        file_digests = dict((f, _digest_files([f])) for f in java_files)
+        unchecked = [
+            f for f in java_files
+            if file_digests[f] not in previous
+            and file_digests[f] not in current
+        ]
+        java_sources = java_source_utils.parse_java_sources(unchecked)
+        for java_file in unchecked:
+            current[file_digests[java_file]] = sorted(
+                find_func(java_sources[java_file].imports))
+        result = {}
+        for java_file in java_files:
+            digest = file_digests[java_file]
+            if digest not in current:
+                current[digest] = previous[digest]
+            result[java_file] = current[digest]
+        return result
+
+    def save(self):
+        """Writes the verdicts of the sources checked since loading.
+
+        Verdicts of sources that were not checked again are dropped.
+        """
+        cache = {'lists': self._lists_digest, 'verdicts': self._current}
+        with build_utils.atomic_output(self.path) as f:
+            f.write(json.dumps(cache, sort_keys=True).encode())
+
+
+def _find_violations(check, java_sources_file_path, cache, find_func):
+    """Returns [(java file, sorted violating imports)] of the listed files.
+
+    Verdicts are reused from |cache| when given.
+    """
+    java_files = _check_file_suffix(
+        _get_java_source_files(java_sources_file_path))
+    if cache is None:
+        java_sources = java_source_utils.parse_java_sources(java_files)
+        return [(f, sorted(find_func(java_sources[f].imports)))
+                for f in java_files]
+    violations = cache.find_violations(check, java_files, find_func)
+    return [(f, violations[f]) for f in java_files]
 
-    for java_file in java_files:
-        imports = parse_import_class(java_file)
-        aosp_imports = set(imports) & set(all_aosp_imports)
-        mixed = set(aosp_imports) & set(checklist)
 
-        # aosp_imports should be a subset of checklist
-        if mixed != set(aosp_imports):
-            diff = set(aosp_imports) - set(checklist)
+def allowlist_check(allow_list_file_path,
+                    java_sources_file_path,
+                    all_aosp_imports_file,
+                    cache=None):
+    checklist = _load_import_index(allow_list_file_path)
+    all_aosp_imports = _load_import_index(all_aosp_imports_file)
+
+    def find_violations(imports):
+        # aosp imports should be a subset of checklist
+        return set(n for n in all_aosp_imports.filter(imports)
+                   if n not in checklist)
+
+    result = "PASS"
+    for java_file, diff in _find_violations('allowlist',
+                                            java_sources_file_path, cache,
+                                            find_violations):
+        if diff:
             _print_in_red(
                 "Error: {}: imported {}, which is not allowed in {}"
                 .format(java_file, ' '.join(diff), allow_list_file_path))
-            return "FAILURE"
-    return "PASS"
-
+            result = "FAILURE"
+    return result
 
-def blocklist_check(block_list_file_path,
-                    java_sources_file_path):
-    checklist = _read_file(block_list_file_path)
 
-    java_files = _get_java_source_files(java_sources_file_path)
-    _check_file_suffix(java_files)
+def blocklist_check(block_list_file_path, java_sources_file_path, cache=None):
+    checklist = _load_import_index(block_list_file_path)
 
-    for f in java_files:
-        imports = parse_import_class(f)
-        mixed = set(imports) & set(checklist)
+    result = "PASS"
+    for java_file, mixed in _find_violations('blocklist',
+                                             java_sources_file_path, cache,
+                                             checklist.filter):
         if mixed:
             _print_in_red(
                 "Error: {}: imported {}, which is not allowed in {}"
-                .format(f, ' '.join(mixed), block_list_file_path))
-            return "FAILURE"
-    return "PASS"
+                .format(java_file, ' '.join(mixed), block_list_file_path))
+            result = "FAILURE"
+    return result
@@ -17,6 +17,7 @@ import optparse
 import sys
 
 from util import build_utils
+from util import trace_utils
 
 
 def _ParseAndFlattenGnLists(gn_lists):
@@ -68,16 +69,24 @@ def main(args):
     if options.strip_args:
         for arg in options.strip_args:
             merge_args += ["--stripFile", arg]
-    build_utils.call_and_write_depfile_if_stale(lambda: build_utils.merge_zips(
-        options.output_jar, sorted(added_jars), merge_args=merge_args),
-                                           options,
-                                           depfile_deps=(options.depjars) +
-                                           (input_jars),
-                                           input_paths=(options.depjars) +
-                                           (input_jars),
-                                           output_paths=([options.output_jar]),
-                                           force=False,
-                                           add_pydeps=False)
+
+    def merge_jars():
+        with trace_utils.phase('merge_zips', count=len(added_jars)):
+            build_utils.merge_zips(options.output_jar, sorted(added_jars),
+                                   merge_args=merge_args)
+
+    try:
+        build_utils.call_and_write_depfile_if_stale(merge_jars,
+                                               options,
+                                               depfile_deps=(options.depjars) +
+                                               (input_jars),
+                                               input_paths=(options.depjars) +
+                                               (input_jars),
+                                               output_paths=([options.output_jar]),
+                                               force=False,
+                                               add_pydeps=False)
+    finally:
+        trace_utils.write_trace(options.output_jar)
 
 
 if __name__ == '__main__':
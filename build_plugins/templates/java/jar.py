@@ -6,72 +6,77 @@
 
 import optparse
 import os
-import shutil
 import sys
-import tempfile
-import distutils.spawn
+import zipfile
 
 from util import build_utils
 
+_MANIFEST_PATH = 'META-INF/MANIFEST.MF'
+_SERVICES_DIR = 'META-INF/services'
+_DEFAULT_MANIFEST = """Manifest-Version: 1.0
+Created-By: build_tools
+"""
 
-def Jar(class_files, classes_dir, jar_path, jar_cmd_path, manifest_file=None,
+
+def _ReadManifest(manifest_file):
+  """Returns the manifest contents to store, as the jar tool would write it."""
+  if not manifest_file:
+    return _DEFAULT_MANIFEST.encode()
+  with open(manifest_file, 'rb') as f:
+    contents = f.read()
+  if not contents.startswith(b'Manifest-Version:'):
+    contents = b'Manifest-Version: 1.0\n' + contents
+  # The last line of a manifest is ignored unless it ends with a newline.
+  if not contents.endswith(b'\n'):
+    contents += b'\n'
+  return contents
+
+
+def Jar(class_files, classes_dir, jar_path, manifest_file=None,
         provider_configurations=None, additional_files=None):
-  jar_path = os.path.abspath(jar_path)
+  """Writes a hermetic, uncompressed jar without spawning the jar tool.
 
-  # The paths of the files in the jar will be the same as they are passed in to
-  # the command. Because of this, the command should be run in
-  # options.classes_dir so the .class file paths in the jar are correct.
+  The manifest is always the first entry. All other entries are sorted by
+  their path in the jar and use build_utils.HERMETIC_TIMESTAMP. Two inputs
+  with the same path in the jar are an error, as with the jar tool.
+  """
+  # The paths of the files in the jar are relative to classes_dir.
   jar_cwd = classes_dir
-  class_files_rel = [os.path.relpath(f, jar_cwd) for f in class_files]
-  with tempfile.NamedTemporaryFile(suffix='.jar') as tmp_jar:
-    jar_cmd = [os.path.relpath(jar_cmd_path, os.path.realpath(classes_dir))]
-    jar_cmd.extend(['cf0', tmp_jar.name])
-    if manifest_file:
-      jar_cmd[1] += 'm'
-      jar_cmd.append(os.path.abspath(manifest_file))
-    jar_cmd.extend(class_files_rel)
-
-    for filepath, jar_filepath in additional_files or []:
-      full_jar_filepath = os.path.join(jar_cwd, jar_filepath)
-      jar_dir = os.path.dirname(full_jar_filepath)
-      if not os.path.exists(jar_dir):
-        os.makedirs(jar_dir)
-      # Some of our JARs are mode 0440 because they exist in the source tree as
-      # symlinks to JARs managed by CIPD. shutil.copyfile copies the contents,
-      # not the permissions, so the resulting copy is writable despite the
-      # the source JAR not being so. (shutil.copy does copy the permissions and
-      # as such doesn't work without changing the mode after.)
-      shutil.copyfile(filepath, full_jar_filepath)
-      jar_cmd.append(jar_filepath)
-
-    if provider_configurations:
-      service_dir = os.path.join(jar_cwd, 'META-INF', 'services')
-      if not os.path.exists(service_dir):
-        os.makedirs(service_dir)
-      for config in provider_configurations:
-        config_jar_path = os.path.join(service_dir, os.path.basename(config))
-        shutil.copy(config, config_jar_path)
-        jar_cmd.append(os.path.relpath(config_jar_path, jar_cwd))
-
-    if not class_files_rel:
-      empty_file = os.path.join(classes_dir, '.empty')
-      build_utils.touch(empty_file)
-      jar_cmd.append(os.path.relpath(empty_file, jar_cwd))
-    build_utils.check_output(jar_cmd, cwd=jar_cwd)
-
-    # Zeros out timestamps so that builds are hermetic.
-    build_utils.merge_zips(jar_path, [tmp_jar.name])
-
-
-def JarDirectory(classes_dir, jar_path, jar_cmd_path, manifest_file=None,
-                 predicate=None, provider_configurations=None,
-                 additional_files=None):
+  jar_inputs = [(os.path.relpath(f, jar_cwd), f) for f in class_files]
+
+  # Additional files and provider configurations are read from where they
+  # are rather than staged in classes_dir first. Some of them exist in the
+  # source tree as symlinks to JARs managed by CIPD, so resolve them to get
+  # the contents into the jar rather than a symlink entry.
+  for filepath, jar_filepath in additional_files or []:
+    jar_inputs.append((jar_filepath, os.path.realpath(filepath)))
+
+  for config in provider_configurations or []:
+    jar_inputs.append((os.path.join(_SERVICES_DIR, os.path.basename(config)),
+                       os.path.realpath(config)))
+
+  # The jar tool refused duplicate entries, while zipfile would only warn.
+  entry_paths = set([_MANIFEST_PATH])
+  for jar_filepath, filepath in jar_inputs:
+    if jar_filepath in entry_paths:
+      raise Exception('Duplicate jar entry: %s (from %s)' %
+                      (jar_filepath, filepath))
+    entry_paths.add(jar_filepath)
+
+  with zipfile.ZipFile(jar_path, 'w') as z:
+    build_utils.add_to_zip_hermetic(
+        z, _MANIFEST_PATH, data=_ReadManifest(manifest_file))
+    build_utils.do_zip(jar_inputs, z)
+
+
+def JarDirectory(classes_dir, jar_path, manifest_file=None, predicate=None,
+                 provider_configurations=None, additional_files=None):
   all_classes = sorted(build_utils.find_in_directory(classes_dir, '*.class'))
   if predicate:
     all_classes = [
         f for f in all_classes if predicate(os.path.relpath(f, classes_dir))]
 
-  Jar(all_classes, classes_dir, jar_path, jar_cmd_path,
+  Jar(all_classes, classes_dir, jar_path,
       manifest_file=manifest_file,
       provider_configurations=provider_configurations,
       additional_files=additional_files)
@@ -81,11 +86,14 @@ def _CreateFilterPredicate(excluded_classes, included_classes):
   if not excluded_classes and not included_classes:
     return None
 
+  is_excluded = build_utils.compile_globs(excluded_classes)
+  is_included = build_utils.compile_globs(included_classes)
+
   def predicate(f):
     # Exclude filters take precedence over include filters.
-    if build_utils.matches_glob(f, excluded_classes):
+    if is_excluded(f):
       return False
-    if included_classes and not build_utils.matches_glob(f, included_classes):
+    if included_classes and not is_included(f):
       return False
     return True
 
@@ -94,6 +102,7 @@ def _CreateFilterPredicate(excluded_classes, included_classes):
 
 def main():
   parser = optparse.OptionParser()
+  # Unused since jars are written in-process; kept for existing callers.
   parser.add_option('--jdkpath', help='path to jdkpath')
   parser.add_option('--classes-dir', help='Directory containing .class files.')
   parser.add_option('--jar-path', help='Jar output path.')
@@ -107,8 +116,8 @@ def main():
   args = build_utils.expand_file_args(sys.argv[1:])
   options, _ = parser.parse_args(args)
 
-  build_utils.check_options(options, parser, required=('jdkpath',))
-  jar_cmd_path = distutils.spawn.find_executable('jar', options.jdkpath)
+  build_utils.check_options(options, parser,
+                            required=('classes_dir', 'jar_path'))
 
   excluded_classes = []
   if options.excluded_classes:
@@ -120,7 +129,6 @@ def main():
   predicate = _CreateFilterPredicate(excluded_classes, included_classes)
   JarDirectory(options.classes_dir,
                options.jar_path,
-               jar_cmd_path,
                predicate=predicate)
 
 
@@ -4,7 +4,10 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import collections
+import concurrent.futures
 import distutils.spawn
+import fnmatch
 import itertools
 import optparse
 import os
@@ -12,13 +15,19 @@ import shutil
 import re
 import sys
 import tempfile
+import time
 
 from util import build_utils
+from util import class_file_utils
 from util import md5_check
 from util import jar_info_utils
+from util import java_source_utils
+from util import trace_utils
+from util import zip_cache
 import check_api
 
 import jar
+import javacd
 
 MANIFEST = """Manifest-Version: 1.0
 Created-By: build_tools
@@ -101,26 +110,26 @@ ERRORPRONE_WARNINGS_TO_ERROR = [
 ]
 
 
-def ProcessJavacOutput(output):
-    # These warnings cannot be suppressed even for third party code. Deprecation
-    # warnings especially do not help since we must support older aosp version.
-    deprecated_re = re.compile(
-        r'(Note: .* uses? or overrides? a deprecated API.)$')
-    unchecked_re = re.compile(
-        r'(Note: .* uses? unchecked or unsafe operations.)$')
-    recompile_re = re.compile(r'(Note: Recompile with -Xlint:.* for details.)$')
+# These warnings cannot be suppressed even for third party code. Deprecation
+# warnings especially do not help since we must support older aosp version.
+_JAVAC_OUTPUT_FILTERS = [
+    re.compile(r'(Note: .* uses? or overrides? a deprecated API.)$'),
+    re.compile(r'(Note: .* uses? unchecked or unsafe operations.)$'),
+    re.compile(r'(Note: Recompile with -Xlint:.* for details.)$'),
+]
+
 
-    def ApplyFilters(line):
-        return not (deprecated_re.match(line)
-                    or unchecked_re.match(line)
-                    or recompile_re.match(line))
+def _KeepJavacOutputLine(line):
+    return not any(f.match(line) for f in _JAVAC_OUTPUT_FILTERS)
+
+
+def ProcessJavacOutput(output):
+    return '\n'.join(filter(_KeepJavacOutputLine,
+                            output.decode().split('\n')))
 
-    def ApplyColors(line):
-        return line
 
-    return '\n'.join(map(ApplyColors,
-                         list(filter(ApplyFilters,
-                                     output.decode().split('\n')))))
+# Matches ".class" and "$*.class" at the end of a class file path.
+_CLASS_FILE_SUFFIX_RE = re.compile(r'(?:\$|\.)[^/]*class$')
 
 
 def _ExtractClassFiles(jar_path, dest_dir, java_files):
@@ -134,57 +143,27 @@ def _ExtractClassFiles(jar_path, dest_dir, java_files):
     #   source path: ../../base/java/src/org/chromium/Foo.java
     #   jar paths: org/chromium/Foo.class, org/chromium/Foo$Inner.class
     # To extract only .class files not related to the given .java files, we strip
-    # off ".class" and "$*.class" and use a substring match against java_files.
+    # off ".class" and "$*.class" and look the remaining path up among all the
+    # path suffixes of java_files.
+    java_file_suffixes = set()
+    for java_file in java_files:
+        parts = java_file.split('/')
+        for i in range(len(parts)):
+            java_file_suffixes.add('/'.join(parts[i:]))
+
     def extract_predicate(path):
         if not path.endswith('.class'):
             return False
-        path_without_suffix = re.sub(r'(?:\$|\.)[^/]*class$', '', path)
-        partial_java_path = path_without_suffix + '.java'
-        return not any(p.endswith(partial_java_path) for p in java_files)
+        path_without_suffix = _CLASS_FILE_SUFFIX_RE.sub('', path)
+        return path_without_suffix + '.java' not in java_file_suffixes
 
-    build_utils.extract_all(jar_path, path=dest_dir, predicate=extract_predicate)
-    for path in build_utils.find_in_directory(dest_dir, '*.class'):
+    extracted = build_utils.extract_all(jar_path,
+                                        path=dest_dir,
+                                        predicate=extract_predicate)
+    for path in extracted:
         shutil.copystat(jar_path, path)
 
 
-def _ConvertToJMakeArgs(javac_cmd, pdb_path):
-    new_args = ['bin/jmake', '-pdb', pdb_path, '-jcexec', javac_cmd[0]]
-    if md5_check.PRINT_EXPLANATIONS:
-        new_args.append('-Xtiming')
-
-    do_not_prefix = ('-classpath', '-bootclasspath')
-    skip_next = False
-    for arg in javac_cmd[1:]:
-        if not skip_next and arg not in do_not_prefix:
-            arg = '-C' + arg
-        new_args.append(arg)
-        skip_next = arg in do_not_prefix
-
-    return new_args
-
-
-def _ParsePackageAndClassNames(java_file):
-    package_name = ''
-    class_names = []
-    with open(java_file) as f:
-        for l in f:
-            # Strip unindented comments.
-            # Considers a leading * as a continuation of a multi-line comment (our
-            # linter doesn't enforce a space before it like there should be).
-            l = re.sub(r'^(?://.*|/?\*.*?(?:\*/\s*|$))', '', l)
-
-            m = re.match(r'package\s+(.*?);', l)
-            if m and not package_name:
-                package_name = m.group(1)
-
-            # Not exactly a proper parser, but works for sources that Chrome uses.
-            # In order to not match nested classes, it just checks for lack of indent.
-            m = re.match(r'(?:\S.*?)?(?:class|@?interface|enum)\s+(.+?)\b', l)
-            if m:
-                class_names.append(m.group(1))
-    return package_name, class_names
-
-
 def _CheckPathMatchesClassName(java_file, package_name, class_name):
     parts = package_name.split('.') + [class_name + '.java']
     expected_path_suffix = os.path.sep.join(parts)
@@ -194,7 +173,8 @@ def _CheckPathMatchesClassName(java_file, package_name, class_name):
                         (java_file, expected_path_suffix))
 
 
-def _CreateInfoFile(java_files, options, srcjar_files, javac_generated_sources):
+def _CreateInfoFile(java_files, options, srcjar_files, javac_generated_sources,
+                    java_sources=None):
     """Writes a .jar.info file.
 
     This maps fully qualified names for classes to either the java file that they
@@ -202,10 +182,16 @@ def _CreateInfoFile(java_files, options, srcjar_files, javac_generated_sources):
 
     For apks this also produces a coalesced .apk.jar.info file combining all the
     .jar.info files of its transitive dependencies.
+
+    |java_sources| optionally holds already scanned JavaSources by path.
     """
+    java_sources = java_sources or {}
     info_data = dict()
     for java_file in itertools.chain(java_files, javac_generated_sources):
-        package_name, class_names = _ParsePackageAndClassNames(java_file)
+        java_source = java_sources.get(java_file)
+        if java_source is None:
+            java_source = java_source_utils.parse_java_source(java_file)
+        package_name, class_names, _ = java_source
         for class_name in class_names:
             fully_qualified_name = '{}.{}'.format(package_name, class_name)
             info_data[fully_qualified_name] = java_file
@@ -226,40 +212,335 @@ def _CreateInfoFile(java_files, options, srcjar_files, javac_generated_sources):
             f.write('\n'.join(keys))
 
 
-def extract_srcjar(srcjar, generated_java_dir, incremental):
+def _WriteIfChanged(path, data):
+    """Writes |data| to |path| unless it already holds exactly that."""
+    try:
+        if os.path.getsize(path) == len(data):
+            with open(path, 'rb') as f:
+                if f.read() == data:
+                    return
+    except OSError:
+        pass
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _SyncGeneratedDir(generated_java_dir, generated_files):
+    """Deletes what |generated_java_dir| holds besides |generated_files|.
+
+    Together with writing only changed files, this syncs the directory with
+    the current srcjars and annotation processor output.
+    """
+    keep = set(os.path.normpath(p) for p in generated_files)
+    for root, _, files in os.walk(generated_java_dir, topdown=False):
+        for name in files:
+            path = os.path.join(root, name)
+            if os.path.normpath(path) not in keep:
+                os.unlink(path)
+        if root != generated_java_dir and not os.listdir(root):
+            os.rmdir(root)
+
+
+def extract_srcjar(srcjar, generated_java_dir):
+    """Writes the .java files of |srcjar| below |generated_java_dir|.
+
+    Each source goes to the directory of its package, whatever its path in
+    the srcjar. Sources are read straight from the srcjar and written once;
+    a file that already has the same content is left untouched, so its mtime
+    stays stable. Two entries that would go to the same file are an error.
+    """
     jar_srcs = []
-    with build_utils.temp_dir() as temp_dir:
-        extracted_files = build_utils.extract_all(
-            srcjar, no_clobber=not incremental, path=temp_dir, pattern='*.java')
-        for f in extracted_files:
-            package_name, _ = _ParsePackageAndClassNames(f)
-            dest_dir = os.path.join(generated_java_dir,
-                                    package_name.replace('.', '/'))
+    entry_names = {}
+    created_dirs = set()
+    z = zip_cache.open_zip(srcjar)
+    for info in z.infolist():
+        if info.is_dir() or not fnmatch.fnmatch(info.filename, '*.java'):
+            continue
+        data = z.read(info)
+        package_name = java_source_utils.parse_java_source_contents(
+            data).package_name
+        dest_dir = os.path.join(generated_java_dir,
+                                package_name.replace('.', '/'))
+        if dest_dir not in created_dirs:
             os.makedirs(dest_dir, exist_ok=True)
-            dest_file = os.path.join(dest_dir, os.path.basename(f))
-            shutil.copy(f, dest_file)
-            jar_srcs.append(dest_file)
-        return jar_srcs
+            created_dirs.add(dest_dir)
+        dest_file = os.path.join(dest_dir, os.path.basename(info.filename))
+        if dest_file in entry_names:
+            raise Exception('Duplicate source in srcjar: %s %s %s %s' %
+                            (srcjar, entry_names[dest_file], info.filename,
+                             dest_file))
+        entry_names[dest_file] = info.filename
+        _WriteIfChanged(dest_file, data)
+        jar_srcs.append(dest_file)
+    return jar_srcs
 
 
 def search_for_allowlist_file(current_dir, top_dir, allowlist):
-    if (not current_dir) or current_dir == top_dir:
-        return None
-    if not os.path.exists(current_dir):
-        return None
-    for file in os.listdir(current_dir):
-        file_path = os.path.join(current_dir, file)
+    """Returns the |allowlist| file nearest to |current_dir|, below |top_dir|.
+
+    Each directory is probed directly for the file, walking up until
+    |top_dir| or the filesystem root, rather than listing its contents.
+    """
+    while current_dir and current_dir != top_dir:
+        file_path = '{}/{}'.format(current_dir, allowlist)
         if os.path.isfile(file_path):
-            if os.path.basename(file_path) == allowlist:
-                return '{}/{}'.format(current_dir, allowlist)
-    return search_for_allowlist_file(os.path.dirname(current_dir),
-                                     top_dir, allowlist)
+            return file_path
+        if not os.path.exists(current_dir):
+            return None
+        parent_dir = os.path.dirname(current_dir)
+        if parent_dir == current_dir:
+            return None
+        current_dir = parent_dir
+    return None
+
 
+def _ReadPreviousBuild(options, srcjar_files):
+    """Returns the classes of the previous .jar and the sources they came from.
 
-def _OnStaleMd5(changes, options, javac_cmd, jar_path, java_files,
-                classpath_inputs, classpath, allowlist):
-    # Don't bother enabling incremental compilation for non-chromium code.
-    incremental = options.incremental and options.chromium_code
+    Returns ({class name: ClassInfo}, {class name: source path}), or None when
+    there is no previous build or a class cannot be traced to its source.
+    """
+    info_path = options.jar_path + '.info'
+    if not os.path.exists(options.jar_path) or not os.path.exists(info_path):
+        return None
+    # .jar.info files refer to srcjar sources by their path inside the srcjar.
+    extracted_paths = {v: k for k, v in srcjar_files.items()}
+    top_level_sources = {}
+    for name, path in jar_info_utils.parse_jar_info_file(info_path).items():
+        top_level_sources[name] = extracted_paths.get(path, path)
+
+    classes = class_file_utils.read_jar_classes(options.jar_path)
+    class_sources = {}
+    for name in classes:
+        source = top_level_sources.get(
+            class_file_utils.top_level_class_name(name))
+        if source is None:
+            return None
+        class_sources[name] = source
+    return classes, class_sources
+
+
+def _FindStaleSources(changes, options, javac_path, java_files,
+                      classpath_inputs, srcjar_files):
+    """Returns the sources that changed, or None if all must be recompiled."""
+    # Annotation processors may generate sources from any input.
+    if (options.processors or changes.input_strings_changed()
+            or changes.missing_outputs):
+        return None
+    java_file_set = set(java_files)
+    stale_sources = set()
+    for path in changes.iter_changed_paths():
+        if path in java_file_set:
+            stale_sources.add(path)
+        elif path in options.java_srcjars:
+            prefix = path + '/'
+            stale_sources.update(p for p, s in srcjar_files.items()
+                                 if s.startswith(prefix))
+        elif path == javac_path or path in classpath_inputs:
+            return None
+    # Removed sources are found by _CompileIncrementally(), their classes are
+    # in the previous .jar but no longer have a source.
+    return stale_sources
+
+
+def _IndexClasses(classes):
+    """Returns the {class: referring classes} and {class: subclasses} maps."""
+    referrers = collections.defaultdict(set)
+    subclasses = collections.defaultdict(set)
+    for name, info in classes.items():
+        for referenced in info.referenced_classes:
+            referrers[referenced].add(name)
+        for supertype in (info.super_name,) + info.interfaces:
+            subclasses[supertype].add(name)
+    return referrers, subclasses
+
+
+def _FindReferrers(index, changed_classes):
+    """Returns the classes that were compiled against |changed_classes|."""
+    referrers, subclasses = index
+    # Code compiled against a subclass can use members it inherits, so it
+    # depends on all supertypes of that subclass as well.
+    affected = set()
+    pending = list(changed_classes)
+    while pending:
+        name = pending.pop()
+        if name not in affected:
+            affected.add(name)
+            pending.extend(subclasses.get(name, ()))
+    result = set()
+    for name in affected:
+        result.update(referrers.get(name, ()))
+    return result
+
+
+def _FindDependentSources(index, class_sources, changed_classes):
+    """Returns the sources that were compiled against |changed_classes|."""
+    return set(class_sources[referrer]
+               for referrer in _FindReferrers(index, changed_classes))
+
+
+def _CompileIncrementally(compile_func, options, classes_dir, previous_build,
+                          stale_sources, java_files):
+    """Recompiles |stale_sources| and the sources affected by them.
+
+    Unaffected classes of the previous .jar are reused. Sources are compiled
+    in rounds: the stale and removed sources first, then the sources that
+    depend on a class whose ABI changed in the previous round, until no ABI
+    changes.
+
+    Returns False if the previous classes cannot be reused. |classes_dir| must
+    then be emptied and all sources compiled.
+    """
+    classes, class_sources = previous_build
+    index = _IndexClasses(classes)
+    java_file_set = set(java_files)
+    removed_classes = set(name for name, source in class_sources.items()
+                          if source not in java_file_set)
+    # Constant values are inlined by javac without a reference to the class
+    # that declared them, so their users cannot be found.
+    if any(classes[name].constants for name in removed_classes):
+        return False
+
+    to_compile = (stale_sources | _FindDependentSources(
+        index, class_sources, removed_classes)) & java_file_set
+    excluded_sources = to_compile | set(class_sources[name]
+                                        for name in removed_classes)
+    _ExtractClassFiles(options.jar_path, classes_dir, sorted(excluded_sources))
+
+    # The classes as they are in |classes_dir| after each round.
+    current = dict((name, info) for name, info in classes.items()
+                   if name not in removed_classes)
+    compiled_classes = set()
+    while to_compile:
+        # Class files of recompiled sources are replaced, and extraction may
+        # also have kept classes whose file name differs from their source.
+        for name, source in class_sources.items():
+            if source in excluded_sources:
+                class_path = os.path.join(classes_dir, name + '.class')
+                if os.path.exists(class_path):
+                    os.unlink(class_path)
+        excluded_sources = set()
+        reused = set(build_utils.find_in_directory(classes_dir, '*.class'))
+
+        compile_func(sorted(to_compile))
+
+        new_classes = {}
+        for path in build_utils.find_in_directory(classes_dir, '*.class'):
+            if path not in reused:
+                with open(path, 'rb') as f:
+                    info = class_file_utils.read_class_file(f.read())
+                new_classes[info.name] = info
+
+        changed_classes = set()
+        for name, source in class_sources.items():
+            if (source in to_compile and name in current
+                    and name not in new_classes):
+                changed_classes.add(name)
+                if current.pop(name).constants:
+                    return False
+        for name, info in new_classes.items():
+            old_info = current.get(name)
+            if old_info is None or old_info.abi != info.abi:
+                changed_classes.add(name)
+            if old_info is not None and old_info.constants != info.constants:
+                return False
+        current.update(new_classes)
+
+        earlier_classes = compiled_classes
+        compiled_classes = compiled_classes | set(new_classes)
+        referrers = _FindReferrers(_IndexClasses(current), changed_classes)
+        # A class compiled in an earlier round was compiled against the old
+        # version of a class that only changed now. Recompiling its source
+        # again could go on for a while, so start over instead.
+        if referrers & earlier_classes:
+            return False
+        to_compile = set(class_sources[name]
+                         for name in referrers - compiled_classes
+                         if name in class_sources) & java_file_set
+        excluded_sources = to_compile
+    return True
+
+
+def _ScanJavaSources(java_files):
+    with trace_utils.phase('scan_sources', count=len(java_files)):
+        return java_source_utils.parse_java_sources(java_files)
+
+
+def _RunJavac(javac_cmd, options, classes_dir, classpath, java_files_rsp_path):
+    # Don't include the output directory in the initial set of args since it
+    # being in a temp dir makes it unstable (breaks md5 stamping).
+    cmd = javac_cmd + ['-d', classes_dir]
+
+    # Pass classpath and source paths as response files to avoid extremely
+    # long command lines that are tedius to debug.
+    if classpath:
+        cmd += ['-classpath', ':'.join(classpath)]
+    cmd += ['@' + java_files_rsp_path]
+
+    # This assumes that all compiler output goes through stderr.
+    keep_stdout = bool(md5_check.PRINT_EXPLANATIONS)
+
+    server_start = time.time()
+    # Errorprone commands never match the server's javac, so they always
+    # run as a subprocess.
+    result = javacd.compile_java(cmd)
+    if result is None:
+        # Diagnostics are shown while javac runs, not when it has finished.
+        # JVM start-up and annotation processing happen inside javac, so they
+        # are part of this phase.
+        with trace_utils.phase('javac', processors=options.processors):
+            return build_utils.check_output_streaming(
+                cmd,
+                print_stdout=options.chromium_code,
+                stdout_line_filter=lambda line: keep_stdout,
+                stderr_line_filter=_KeepJavacOutputLine)
+    # Only recorded once the server did compile, so a missing or mismatched
+    # server does not show up as a phase.
+    trace_utils.record('javac_server', server_start, time.time())
+    returncode, stdout, stderr = result
+    return build_utils.handle_process_output(
+        cmd,
+        os.getcwd(),
+        returncode,
+        stdout,
+        stderr,
+        print_stdout=options.chromium_code,
+        stdout_filter=None if keep_stdout else lambda s: '',
+        stderr_filter=ProcessJavacOutput)
+
+
+def _ApiListFiles(options, allowlist):
+    """Returns the list files check_api reads besides the sources."""
+    if not options.ohos_code:
+        return []
+    list_files = [options.mcl_api_blocklist_file, allowlist]
+    if allowlist:
+        list_files.append(options.all_aosp_imports_file)
+    return [f for f in list_files if f]
+
+
+def _CheckApi(options, allowlist, java_files_rsp_path, cache):
+    try:
+        # Check whether java files import classes that MCL not supported.
+        if options.mcl_api_blocklist_file and check_api.blocklist_check(
+                options.mcl_api_blocklist_file, java_files_rsp_path,
+                cache=cache) == "FAILURE":
+            exit(1)
+
+        # Check whether java files import extra APIs beyond api allowlist
+        if allowlist and check_api.allowlist_check(
+                allowlist, java_files_rsp_path,
+                options.all_aosp_imports_file, cache=cache) == "FAILURE":
+            exit(1)
+    finally:
+        # Verdicts are kept when a check fails, so the next build only
+        # re-checks the sources that were edited.
+        cache.save()
+
+
+def _OnStaleMd5(changes, options, javac_cmd, java_files, classpath_inputs,
+                classpath, allowlist):
+    incremental = options.incremental
 
     with build_utils.temp_dir() as temp_dir:
         srcjars = options.java_srcjars
@@ -267,132 +548,81 @@ def _OnStaleMd5(changes, options, javac_cmd, jar_path, java_files,
         classes_dir = os.path.join(temp_dir, 'classes')
         os.makedirs(classes_dir)
 
-        changed_paths = None
-        # jmake can handle deleted files, but it's a rare case and it would
-        # complicate this script's logic.
-        if incremental and changes.added_or_modified_only():
-            changed_paths = set(changes.iter_changed_paths())
-            # Do a full compile if classpath has changed.
-            # jmake doesn't seem to do this on its own... Might be that ijars mess up
-            # its change-detection logic.
-            if any(p in changed_paths for p in classpath_inputs):
-                changed_paths = None
-
-        if options.incremental:
-            pdb_path = options.jar_path + '.pdb'
-
-        if incremental:
-            # jmake is a compiler wrapper that figures out the minimal set of .java
-            # files that need to be rebuilt given a set of .java files that have
-            # changed.
-            # jmake determines what files are stale based on timestamps between .java
-            # and .class files. Since we use .jars, .srcjars, and md5 checks,
-            # timestamp info isn't accurate for this purpose. Rather than use jmake's
-            # programmatic interface (like we eventually should), we ensure that all
-            # .class files are newer than their .java files, and convey to jmake which
-            # sources are stale by having their .class files be missing entirely
-            # (by not extracting them).
-            javac_cmd = _ConvertToJMakeArgs(javac_cmd, pdb_path)
-
+        # Generated sources are synced rather than recreated, so unchanged
+        # files keep their timestamps. See _SyncGeneratedDir().
         generated_java_dir = options.generated_dir
-        # Incremental means not all files will be extracted, so don't bother
-        # clearing out stale generated files.
-        if not incremental:
-            shutil.rmtree(generated_java_dir, True)
 
         srcjar_files = {}
+        scanned_sources = None
+        api_check_cache = check_api.VerdictCache(
+            options.jar_path + '.api_check',
+            _ApiListFiles(options, allowlist))
         if srcjars:
             build_utils.make_directory(generated_java_dir)
             jar_srcs = []
-            for srcjar in options.java_srcjars:
-                if changed_paths:
-                    changed_paths.update(os.path.join(generated_java_dir, f)
-                                         for f in
-                                         changes.iter_changed_subpaths(srcjar))
-                extracted_files = extract_srcjar(srcjar, generated_java_dir,
-                                                 incremental)
-                for path in extracted_files:
-                    # We want the path inside the srcjar so the viewer can have a tree
-                    # structure.
-                    srcjar_files[path] = '{}/{}'.format(
-                        srcjar, os.path.relpath(path, generated_java_dir))
-                jar_srcs.extend(extracted_files)
+            with trace_utils.phase('extract_srcjars'):
+                for srcjar in options.java_srcjars:
+                    extracted_files = extract_srcjar(srcjar, generated_java_dir)
+                    for path in extracted_files:
+                        # We want the path inside the srcjar so the viewer can have a tree
+                        # structure.
+                        srcjar_files[path] = '{}/{}'.format(
+                            srcjar, os.path.relpath(path, generated_java_dir))
+                    jar_srcs.extend(extracted_files)
             java_files.extend(jar_srcs)
-            if changed_paths:
-                # Set the mtime of all sources to 0 since we use the absence of .class
-                # files to tell jmake which files are stale.
-                for path in jar_srcs:
-                    os.utime(path, (0, 0))
 
         if java_files:
-            if changed_paths:
-                changed_java_files = [p for p in java_files if
-                                      p in changed_paths]
-                if os.path.exists(options.jar_path):
-                    _ExtractClassFiles(options.jar_path, classes_dir,
-                                       changed_java_files)
-                # Add the extracted files to the classpath. This is required because
-                # when compiling only a subset of files, classes that haven't changed
-                # need to be findable.
-                classpath.append(classes_dir)
-
-            # Can happen when a target goes from having no sources, to having sources.
-            # It's created by the call to build_utils.touch() below.
-            if incremental:
-                if os.path.exists(pdb_path) and not os.path.getsize(pdb_path):
-                    os.unlink(pdb_path)
-
-            # Don't include the output directory in the initial set of args since it
-            # being in a temp dir makes it unstable (breaks md5 stamping).
-            cmd = javac_cmd + ['-d', classes_dir]
-
-            # Pass classpath and source paths as response files to avoid extremely
-            # long command lines that are tedius to debug.
-            if classpath:
-                cmd += ['-classpath', ':'.join(classpath)]
-
             java_files_rsp_path = os.path.join(temp_dir, 'files_list.txt')
             with open(java_files_rsp_path, 'w') as f:
                 f.write(' '.join(java_files))
             if options.ohos_code:
-                # Check whether java files import classes that MCL not supported.
-                if options.mcl_api_blocklist_file and (
-                        check_api.blocklist_check(
-                                options.mcl_api_blocklist_file,
-                                java_files_rsp_path) == "FAILURE"):
-                    exit(1)
-
-                # Check whether java files import extra APIs beyond api allowlist
-                if allowlist and check_api.allowlist_check(
-                        allowlist, java_files_rsp_path,
-                        options.all_aosp_imports_file) == "FAILURE":
-                    exit(1)
-
-            cmd += ['@' + java_files_rsp_path]
-
-            # JMake prints out some diagnostic logs that we want to ignore.
-            # This assumes that all compiler output goes through stderr.
-            stdout_filter = lambda s: ''
-            if md5_check.PRINT_EXPLANATIONS:
-                stdout_filter = None
-
-            attempt_build = lambda: build_utils.check_output(
-                cmd,
-                print_stdout=options.chromium_code,
-                stdout_filter=stdout_filter,
-                stderr_filter=ProcessJavacOutput)
-            try:
-                attempt_build()
-            except build_utils.called_process_error as e:
-                # Work-around for a bug in jmake (http://crbug.com/551449).
-                if ('project database corrupted' not in e.output and
-                        'jmake: internal Java exception' not in e.output):
-                    raise
-                print(
-                    'Applying work-around for jmake project database corrupted '
-                    '(http://crbug.com/551449).')
-                os.unlink(pdb_path)
-                attempt_build()
+                with trace_utils.phase('check_api'):
+                    _CheckApi(options, allowlist, java_files_rsp_path,
+                              api_check_cache)
+
+            # Scan the sources for the .jar.info while javac runs. This thread
+            # mostly waits on javac meanwhile, so the two hardly compete.
+            scan_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1)
+            scanned_sources = scan_executor.submit(_ScanJavaSources,
+                                                   list(java_files))
+            scan_executor.shutdown(wait=False)
+
+            compiled = False
+            if incremental:
+                with trace_utils.phase('plan_incremental'):
+                    stale_sources = _FindStaleSources(changes, options,
+                                                      javac_cmd[0], java_files,
+                                                      classpath_inputs,
+                                                      srcjar_files)
+                    previous_build = None
+                    if stale_sources is not None:
+                        previous_build = _ReadPreviousBuild(options,
+                                                            srcjar_files)
+                if previous_build:
+                    stale_files_rsp_path = os.path.join(temp_dir,
+                                                        'stale_files_list.txt')
+
+                    def compile_stale(sources):
+                        with open(stale_files_rsp_path, 'w') as f:
+                            f.write(' '.join(sources))
+                        # Unchanged classes are reused from |classes_dir|.
+                        _RunJavac(javac_cmd, options, classes_dir,
+                                  classpath + [classes_dir],
+                                  stale_files_rsp_path)
+
+                    compiled = _CompileIncrementally(compile_stale, options,
+                                                     classes_dir,
+                                                     previous_build,
+                                                     stale_sources, java_files)
+                    if not compiled:
+                        shutil.rmtree(classes_dir)
+                        os.makedirs(classes_dir)
+            if not compiled:
+                _RunJavac(javac_cmd, options, classes_dir, classpath,
+                          java_files_rsp_path)
+        # Also written when nothing was checked, since it is a declared output.
+        api_check_cache.save()
         if options.sources_file:
             with build_utils.atomic_output(options.sources_file,
                                           only_if_changed=True) as temp_f:
@@ -405,25 +635,28 @@ def _OnStaleMd5(changes, options, javac_cmd, jar_path, java_files,
             dst_path = os.path.join(
                 generated_java_dir, os.path.relpath(src_path, classes_dir))
             build_utils.make_directory(os.path.dirname(dst_path))
-            shutil.move(src_path, dst_path)
+            with open(src_path, 'rb') as f:
+                _WriteIfChanged(dst_path, f.read())
+            os.unlink(src_path)
             javac_generated_sources.append(dst_path)
+        if generated_java_dir:
+            _SyncGeneratedDir(generated_java_dir,
+                              list(srcjar_files) + javac_generated_sources)
 
-        _CreateInfoFile(java_files, options, srcjar_files,
-                        javac_generated_sources)
-
-        if options.incremental and (not java_files or not incremental):
-            # Make sure output exists.
-            build_utils.touch(pdb_path)
+        with trace_utils.phase('jar_info'):
+            _CreateInfoFile(
+                java_files, options, srcjar_files, javac_generated_sources,
+                scanned_sources.result() if scanned_sources else None)
 
         if options.manifest_file:
             manifest_file = options.manifest_file
         else:
             manifest_file = _CreateManifestFile(options.jar_path,
                                                 options.main_class)
-        with build_utils.atomic_output(options.jar_path) as f:
+        with trace_utils.phase('jar'), build_utils.atomic_output(
+                options.jar_path) as f:
             jar.JarDirectory(classes_dir,
                              f.name,
-                             jar_path,
                              manifest_file=manifest_file,
                              provider_configurations=options.provider_configurations,
                              additional_files=options.additional_jar_files)
@@ -489,7 +722,8 @@ def _ParseOptions(argv):
         '--incremental',
         action='store_true',
         help='Whether to re-use .class files rather than recompiling them '
-             '(when possible).')
+             '(when possible). Only the changed sources and the sources that '
+             'depend on their ABI are recompiled.')
     parser.add_option(
         '--processors',
         action='append',
@@ -610,7 +844,6 @@ def main(argv):
         javac_path = options.use_errorprone_path
     else:
         javac_path = distutils.spawn.find_executable('javac', options.jdkpath)
-    jar_path = distutils.spawn.find_executable('jar', options.jdkpath)
     javac_cmd = [javac_path]
 
     javac_cmd.extend((
@@ -689,22 +922,36 @@ def main(argv):
     # GN already knows of java_files, so listing them just make things worse when
     # they change.
     depfile_deps = ([javac_path] + classpath_inputs + options.java_srcjars)
-    depfile_deps += ([jar_path])
+
+    # Without annotation processors only the ABI of classpath jars can affect
+    # the output, so key staleness on it instead of on the jars' contents.
+    # This keeps implementation-only changes in dependencies from cascading.
+    abi_classpath = []
+    if not options.processors:
+        abi_classpath = [p for p in classpath if p.endswith('.jar')]
+    # Fingerprints are cached next to the output jar by jar size and mtime, so
+    # only jars that were rebuilt get parsed again.
+    abi_fingerprints = class_file_utils.jar_abi_fingerprints(
+        abi_classpath, options.jar_path + '.classpath_abi')
+    classpath_abi = [
+        '{}:{}'.format(p, abi_fingerprints[p]) for p in abi_classpath
+    ]
+    classpath_inputs = [p for p in classpath_inputs if p not in abi_classpath]
     if options.additional_jar_files:
         for arg in options.additional_jar_files:
             depfile_deps.append(arg[0])
     if options.manifest_file:
         depfile_deps += ([options.manifest_file])
-    input_paths = depfile_deps + java_files
+    input_paths = ([p for p in depfile_deps if p not in abi_classpath] +
+                   java_files)
 
     output_paths = [
         options.jar_path,
         options.jar_path + '.info',
+        options.jar_path + '.api_check',
     ]
     if options.jni_output_dir:
         output_paths += [options.jni_output_dir]
-    if options.incremental:
-        output_paths.append(options.jar_path + '.pdb')
     if options.test_target:
         output_paths.append(options.jar_path + '.info.test')
     if options.java_srcjars:
@@ -731,18 +978,22 @@ def main(argv):
 
     # List python deps in input_strings rather than input_paths since the contents
     # of them does not change what gets written to the depsfile.
-    build_utils.call_and_write_depfile_if_stale(
-        lambda changes: _OnStaleMd5(changes, options, javac_cmd, jar_path,
-                                    java_files, classpath_inputs, classpath,
-                                    allowlist),
-        options,
-        depfile_deps=depfile_deps,
-        input_paths=input_paths,
-        input_strings=javac_cmd + classpath,
-        output_paths=output_paths,
-        force=force,
-        pass_changes=True,
-        add_pydeps=False)
+    try:
+        with trace_utils.phase('javac.py'):
+            build_utils.call_and_write_depfile_if_stale(
+                lambda changes: _OnStaleMd5(changes, options, javac_cmd,
+                                            java_files, classpath_inputs,
+                                            classpath, allowlist),
+                options,
+                depfile_deps=depfile_deps,
+                input_paths=input_paths,
+                input_strings=javac_cmd + classpath + classpath_abi,
+                output_paths=output_paths,
+                force=force,
+                pass_changes=True,
+                add_pydeps=False)
+    finally:
+        trace_utils.write_trace(options.jar_path)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,165 @@
+/*
+ * Copyright (c) 2026 Huawei Device Co., Ltd.
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+import com.sun.net.httpserver.HttpExchange;
+import com.sun.net.httpserver.HttpServer;
+
+import java.io.BufferedReader;
+import java.io.ByteArrayOutputStream;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.InputStreamReader;
+import java.io.OutputStream;
+import java.io.PrintStream;
+import java.net.InetAddress;
+import java.net.InetSocketAddress;
+import java.nio.charset.StandardCharsets;
+import java.nio.file.Files;
+import java.nio.file.Paths;
+import java.security.MessageDigest;
+import java.util.ArrayList;
+import java.util.List;
+import java.util.concurrent.ExecutorService;
+import java.util.concurrent.Executors;
+
+import javax.tools.JavaCompiler;
+import javax.tools.ToolProvider;
+
+/**
+ * Keeps one warm JVM with javac loaded so that javac.py does not pay JVM
+ * start-up and JIT warm-up for every target.
+ *
+ * <p>Usage: JavacServer PORT_FILE [THREADS]. The server binds an ephemeral
+ * loopback port and writes it to PORT_FILE once it accepts requests.
+ *
+ * <p>The first line of stdin is a secret token. Any local process can reach
+ * the port, so every request must carry the token in the X-Javac-Server-Token
+ * header, or it is refused with 403 without being run.
+ *
+ * <p>POST /compile takes the javac arguments separated by NUL bytes and
+ * answers with "EXIT_CODE\nSTDOUT_LENGTH\n" followed by the stdout and
+ * stderr bytes of the compilation. Every request runs a separate
+ * compilation task with its own output streams, so requests never share
+ * compiler state. POST /stop shuts the server down.
+ */
+public final class JavacServer {
+    private static final int EXIT_SYSTEM_ERROR = 3;
+
+    private static final String TOKEN_HEADER = "X-Javac-Server-Token";
+
+    private static final int HTTP_FORBIDDEN = 403;
+
+    private JavacServer() {
+    }
+
+    public static void main(String[] args) throws IOException {
+        int threads = args.length > 1 ? Integer.parseInt(args[1]) : Runtime.getRuntime().availableProcessors();
+        JavaCompiler compiler = ToolProvider.getSystemJavaCompiler();
+        if (compiler == null) {
+            System.err.println("JavacServer: no system java compiler, a JDK is required");
+            System.exit(EXIT_SYSTEM_ERROR);
+        }
+
+        String token = new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8)).readLine();
+        if (token == null || token.isEmpty()) {
+            System.err.println("JavacServer: expected a token on stdin");
+            System.exit(EXIT_SYSTEM_ERROR);
+        }
+        byte[] tokenBytes = token.getBytes(StandardCharsets.UTF_8);
+
+        HttpServer server = HttpServer.create(new InetSocketAddress(InetAddress.getLoopbackAddress(), 0), 0);
+        ExecutorService executor = Executors.newFixedThreadPool(threads);
+        server.createContext("/compile", exchange -> {
+            if (authorize(exchange, tokenBytes)) {
+                compile(compiler, exchange);
+            }
+        });
+        server.createContext("/stop", exchange -> {
+            if (!authorize(exchange, tokenBytes)) {
+                return;
+            }
+            reply(exchange, new byte[0]);
+            new Thread(() -> {
+                server.stop(0);
+                executor.shutdown();
+            }).start();
+        });
+        server.setExecutor(executor);
+        server.start();
+
+        String port = Integer.toString(server.getAddress().getPort());
+        Files.write(Paths.get(args[0]), port.getBytes(StandardCharsets.UTF_8));
+    }
+
+    /**
+     * Returns whether |exchange| carries the server token, and answers it
+     * with 403 when it does not.
+     */
+    private static boolean authorize(HttpExchange exchange, byte[] token) throws IOException {
+        String given = exchange.getRequestHeaders().getFirst(TOKEN_HEADER);
+        if (given != null && MessageDigest.isEqual(token, given.getBytes(StandardCharsets.UTF_8))) {
+            return true;
+        }
+        exchange.sendResponseHeaders(HTTP_FORBIDDEN, -1);
+        exchange.close();
+        return false;
+    }
+
+    private static void compile(JavaCompiler compiler, HttpExchange exchange) throws IOException {
+        List<String> arguments = new ArrayList<>();
+        for (String arg : readAll(exchange.getRequestBody()).split("\0")) {
+            if (!arg.isEmpty()) {
+                arguments.add(arg);
+            }
+        }
+
+        ByteArrayOutputStream stdout = new ByteArrayOutputStream();
+        ByteArrayOutputStream stderr = new ByteArrayOutputStream();
+        int exitCode;
+        try (PrintStream out = new PrintStream(stdout, true, "UTF-8");
+                PrintStream err = new PrintStream(stderr, true, "UTF-8")) {
+            try {
+                exitCode = compiler.run(null, out, err, arguments.toArray(new String[0]));
+            } catch (RuntimeException | Error e) {
+                e.printStackTrace(err);
+                exitCode = EXIT_SYSTEM_ERROR;
+            }
+        }
+
+        byte[] header = (exitCode + "\n" + stdout.size() + "\n").getBytes(StandardCharsets.UTF_8);
+        ByteArrayOutputStream body = new ByteArrayOutputStream(header.length + stdout.size() + stderr.size());
+        body.write(header);
+        stdout.writeTo(body);
+        stderr.writeTo(body);
+        reply(exchange, body.toByteArray());
+    }
+
+    private static String readAll(InputStream in) throws IOException {
+        ByteArrayOutputStream buffer = new ByteArrayOutputStream();
+        byte[] chunk = new byte[8192];
+        int count;
+        while ((count = in.read(chunk)) != -1) {
+            buffer.write(chunk, 0, count);
+        }
+        return new String(buffer.toByteArray(), StandardCharsets.UTF_8);
+    }
+
+    private static void reply(HttpExchange exchange, byte[] body) throws IOException {
+        exchange.sendResponseHeaders(200, body.length == 0 ? -1 : body.length);
+        try (OutputStream out = exchange.getResponseBody()) {
+            out.write(body);
+        }
+    }
+}
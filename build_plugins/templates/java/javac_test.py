@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026 Huawei Device Co., Ltd.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import struct
+import sys
+import tempfile
+import unittest
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import javac  # noqa: E402
+from util import class_file_utils  # noqa: E402
+
+_ACC_PUBLIC = 0x0001
+_ACC_PRIVATE = 0x0002
+_ACC_STATIC = 0x0008
+_ACC_FINAL = 0x0010
+
+
+def _class_file(name,
+                super_name='java/lang/Object',
+                interfaces=(),
+                fields=(),
+                methods=(),
+                references=()):
+    """Returns the bytes of a minimal .class file.
+
+    |fields| are (flags, name, descriptor, int constant or None) and
+    |methods| are (flags, name, descriptor, code bytes). |references| are
+    classes the method bodies would use.
+    """
+    pool = []
+
+    def add(entry):
+        pool.append(entry)
+        return len(pool)
+
+    def utf8(value):
+        data = value.encode('utf-8')
+        return add(struct.pack('>BH', 1, len(data)) + data)
+
+    def class_ref(value):
+        return add(struct.pack('>BH', 7, utf8(value)))
+
+    this_index = class_ref(name)
+    super_index = class_ref(super_name)
+    interface_indexes = [class_ref(i) for i in interfaces]
+    for reference in references:
+        class_ref(reference)
+
+    def member(flags, member_name, descriptor, attributes):
+        data = struct.pack('>HHHH', flags, utf8(member_name), utf8(descriptor),
+                           len(attributes))
+        for attribute_name, body in attributes:
+            data += struct.pack('>HI', utf8(attribute_name), len(body)) + body
+        return data
+
+    field_data = []
+    for flags, field_name, descriptor, constant in fields:
+        attributes = []
+        if constant is not None:
+            value_index = add(struct.pack('>Bi', 3, constant))
+            attributes.append(('ConstantValue',
+                               struct.pack('>H', value_index)))
+        field_data.append(member(flags, field_name, descriptor, attributes))
+    method_data = []
+    for flags, method_name, descriptor, code in methods:
+        body = struct.pack('>HHI', 1, 1, len(code)) + code + struct.pack(
+            '>HH', 0, 0)
+        method_data.append(
+            member(flags, method_name, descriptor, [('Code', body)]))
+
+    data = struct.pack('>IHH', 0xCAFEBABE, 0, 52)
+    data += struct.pack('>H', len(pool) + 1) + b''.join(pool)
+    data += struct.pack('>HHHH', 0x0021, this_index, super_index,
+                        len(interface_indexes))
+    data += b''.join(struct.pack('>H', i) for i in interface_indexes)
+    data += struct.pack('>H', len(field_data)) + b''.join(field_data)
+    data += struct.pack('>H', len(method_data)) + b''.join(method_data)
+    data += struct.pack('>H', 0)
+    return data
+
+
+def _method(name, code=b'\xb1', flags=_ACC_PUBLIC, descriptor='()V'):
+    return (flags, name, descriptor, code)
+
+
+def _constant(name, value):
+    return (_ACC_PUBLIC | _ACC_STATIC | _ACC_FINAL, name, 'I', value)
+
+
+class ReadClassFileTest(unittest.TestCase):
+    def _read(self, name='p/A', **kwargs):
+        return class_file_utils.read_class_file(_class_file(name, **kwargs))
+
+    def test_body_change_keeps_abi(self):
+        before = self._read(methods=[_method('run', b'\x03\xac')])
+        after = self._read(methods=[_method('run', b'\x04\xac')])
+        self.assertEqual(before.abi, after.abi)
+
+    def test_private_member_change_keeps_abi(self):
+        before = self._read(methods=[_method('run')])
+        after = self._read(
+            methods=[_method('run'),
+                     _method('helper', flags=_ACC_PRIVATE)])
+        self.assertEqual(before.abi, after.abi)
+
+    def test_public_member_change_changes_abi(self):
+        before = self._read(methods=[_method('run')])
+        after = self._read(methods=[_method('run'), _method('stop')])
+        self.assertNotEqual(before.abi, after.abi)
+
+    def test_references_and_constants(self):
+        info = self._read(super_name='p/Base',
+                          interfaces=['p/Api'],
+                          fields=[_constant('SIZE', 4)],
+                          methods=[
+                              _method('get', descriptor='(Lp/Arg;)Lp/Ret;')
+                          ],
+                          references=['p/Used'])
+        self.assertEqual(info.super_name, 'p/Base')
+        self.assertEqual(info.interfaces, ('p/Api', ))
+        self.assertEqual(
+            info.referenced_classes,
+            frozenset(['p/Base', 'p/Api', 'p/Used', 'p/Arg', 'p/Ret']))
+        self.assertEqual(list(info.constants), ['SIZE'])
+
+
+class FindDependentSourcesTest(unittest.TestCase):
+    def _classes(self, class_files):
+        return dict((info.name, info) for info in (
+            class_file_utils.read_class_file(data) for data in class_files))
+
+    def test_referrers(self):
+        classes = self._classes([
+            _class_file('p/A'),
+            _class_file('p/B', references=['p/A']),
+            _class_file('p/C'),
+        ])
+        class_sources = dict((n, n + '.java') for n in classes)
+        index = javac._IndexClasses(classes)
+        self.assertEqual(
+            javac._FindDependentSources(index, class_sources, ['p/A']),
+            set(['p/B.java']))
+
+    def test_subclass_referrer(self):
+        # Code using Sub may call members Sub inherits from A.
+        classes = self._classes([
+            _class_file('p/A'),
+            _class_file('p/Sub', super_name='p/A'),
+            _class_file('p/User', references=['p/Sub']),
+        ])
+        class_sources = dict((n, n + '.java') for n in classes)
+        index = javac._IndexClasses(classes)
+        self.assertEqual(
+            javac._FindDependentSources(index, class_sources, ['p/A']),
+            set(['p/Sub.java', 'p/User.java']))
+
+
+class _Options(object):
+    def __init__(self, jar_path):
+        self.jar_path = jar_path
+
+
+class CompileIncrementallyTest(unittest.TestCase):
+    """Runs _CompileIncrementally() with a fake compiler.
+
+    The fake compiler writes the class files that |self._sources| maps each
+    source to, so a test describes a build as the classes of each source.
+    """
+
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._temp_dir.cleanup)
+        self._classes_dir = os.path.join(self._temp_dir.name, 'classes')
+        os.mkdir(self._classes_dir)
+        self._jar_path = os.path.join(self._temp_dir.name, 'out.jar')
+        self._sources = {}
+        self._rounds = []
+
+    def _write_previous_build(self, sources):
+        """Writes |sources| ({source: [class file]}) as the previous jar."""
+        classes = {}
+        class_sources = {}
+        with zipfile.ZipFile(self._jar_path, 'w') as z:
+            for source, class_files in sources.items():
+                for data in class_files:
+                    info = class_file_utils.read_class_file(data)
+                    z.writestr(info.name + '.class', data)
+                    classes[info.name] = info
+                    class_sources[info.name] = source
+        return classes, class_sources
+
+    def _compile(self, sources):
+        self._rounds.append(sources)
+        for source in sources:
+            for data in self._sources[source]:
+                info = class_file_utils.read_class_file(data)
+                with open(os.path.join(self._classes_dir, info.name + '.class'),
+                          'wb') as f:
+                    f.write(data)
+
+    def _build(self, previous, current, stale_sources):
+        self._sources = current
+        return javac._CompileIncrementally(self._compile,
+                                           _Options(self._jar_path),
+                                           self._classes_dir,
+                                           self._write_previous_build(previous),
+                                           set(stale_sources), list(current))
+
+    def _class_names(self):
+        return sorted(
+            os.path.relpath(p, self._classes_dir)
+            for p in javac.build_utils.find_in_directory(
+                self._classes_dir, '*.class'))
+
+    def test_body_only_change(self):
+        user = [_class_file('p/B', references=['p/A'])]
+        previous = {
+            'src/p/A.java': [_class_file('p/A', methods=[_method('run')])],
+            'src/p/B.java': user,
+        }
+        current = {
+            'src/p/A.java':
+            [_class_file('p/A', methods=[_method('run', b'\x00\xb1')])],
+            'src/p/B.java': user,
+        }
+        self.assertTrue(self._build(previous, current, ['src/p/A.java']))
+        self.assertEqual(self._rounds, [['src/p/A.java']])
+        self.assertEqual(self._class_names(), ['p/A.class', 'p/B.class'])
+
+    def test_abi_change(self):
+        user = [_class_file('p/B', references=['p/A'])]
+        previous = {
+            'src/p/A.java': [_class_file('p/A', methods=[_method('run')])],
+            'src/p/B.java': user,
+            'src/p/C.java': [_class_file('p/C')],
+        }
+        current = {
+            'src/p/A.java':
+            [_class_file('p/A', methods=[_method('run'),
+                                         _method('stop')])],
+            'src/p/B.java': user,
+            'src/p/C.java': [_class_file('p/C')],
+        }
+        self.assertTrue(self._build(previous, current, ['src/p/A.java']))
+        self.assertEqual(self._rounds, [['src/p/A.java'], ['src/p/B.java']])
+
+    def test_removed_source(self):
+        user = [_class_file('p/B', references=['p/A'])]
+        previous = {
+            'src/p/A.java': [_class_file('p/A')],
+            'src/p/B.java': user,
+            'src/p/C.java': [_class_file('p/C')],
+        }
+        current = {
+            'src/p/B.java': user,
+            'src/p/C.java': [_class_file('p/C')],
+        }
+        self.assertTrue(self._build(previous, current, []))
+        self.assertEqual(self._rounds, [['src/p/B.java']])
+        self.assertEqual(self._class_names(), ['p/B.class', 'p/C.class'])
+
+    def test_constant_change_compiles_everything(self):
+        previous = {
+            'src/p/A.java': [_class_file('p/A', fields=[_constant('N', 1)])],
+            'src/p/B.java': [_class_file('p/B')],
+        }
+        current = {
+            'src/p/A.java': [_class_file('p/A', fields=[_constant('N', 2)])],
+            'src/p/B.java': [_class_file('p/B')],
+        }
+        self.assertFalse(self._build(previous, current, ['src/p/A.java']))
+
+    def test_subclass_referrer(self):
+        previous = {
+            'src/p/A.java': [_class_file('p/A', methods=[_method('run')])],
+            'src/p/Sub.java': [_class_file('p/Sub', super_name='p/A')],
+            'src/p/User.java': [_class_file('p/User', references=['p/Sub'])],
+        }
+        current = dict(previous)
+        current['src/p/A.java'] = [
+            _class_file('p/A', methods=[_method('run'),
+                                        _method('stop')])
+        ]
+        self.assertTrue(self._build(previous, current, ['src/p/A.java']))
+        self.assertEqual(self._rounds,
+                         [['src/p/A.java'], ['src/p/Sub.java',
+                                             'src/p/User.java']])
+
+    def test_referrer_compiled_in_earlier_round(self):
+        # Z is compiled in the first round against Y, whose ABI only
+        # changes in the second round, when it is recompiled because of X.
+        previous = {
+            'src/p/X.java': [_class_file('p/X', methods=[_method('a')])],
+            'src/p/Y.java': [
+                _class_file('p/Y',
+                            methods=[_method('b')],
+                            references=['p/X'])
+            ],
+            'src/p/Z.java': [_class_file('p/Z', references=['p/Y'])],
+        }
+        current = {
+            'src/p/X.java':
+            [_class_file('p/X', methods=[_method('a'),
+                                         _method('c')])],
+            'src/p/Y.java': [
+                _class_file('p/Y',
+                            methods=[_method('b'), _method('d')],
+                            references=['p/X'])
+            ],
+            'src/p/Z.java': [_class_file('p/Z', references=['p/Y'])],
+        }
+        self.assertFalse(
+            self._build(previous, current, ['src/p/X.java', 'src/p/Z.java']))
+        self.assertEqual(self._rounds,
+                         [['src/p/X.java', 'src/p/Z.java'], ['src/p/Y.java']])
+
+
+if __name__ == '__main__':
+    unittest.main()
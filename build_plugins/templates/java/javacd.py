@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026 Huawei Device Co., Ltd.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Persistent javac server.
+
+Starting a JVM and warming up javac dominates the cost of compiling small
+java targets. When JAVAC_SERVER_DIR is set and a server has been started with
+--start, javac.py hands its compiles to one long-lived JVM instead of
+spawning javac for every target. Whenever the server is unavailable, or
+cannot serve a command, javac.py falls back to running javac itself.
+"""
+
+import os
+import sys
+import argparse
+import json
+import secrets
+import subprocess
+import time
+import http.client as client
+
+JAVAC_SERVER_DIR = os.environ.get('JAVAC_SERVER_DIR')
+_SERVER_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'javac_server', 'JavacServer.java')
+_SERVER_CLASS = 'JavacServer'
+_START_TIMEOUT = 60
+# Requests without the token from the config file are refused by the server.
+_TOKEN_HEADER = 'X-Javac-Server-Token'
+_JVM_ARGS = [
+    '-Xmx4096M',
+    '-XX:CICompilerCount=6',
+    '-XX:+UseDynamicNumberOfGCThreads',
+]
+
+
+def _config_file(root):
+    return os.path.join(root, '.config')
+
+
+def _build_server(jdk_bin, classes_dir):
+    class_file = os.path.join(classes_dir, _SERVER_CLASS + '.class')
+    if (os.path.exists(class_file) and
+            os.path.getmtime(class_file) >= os.path.getmtime(_SERVER_SOURCE)):
+        return
+    os.makedirs(classes_dir, exist_ok=True)
+    subprocess.check_call([
+        os.path.join(jdk_bin, 'javac'), '-encoding', 'UTF-8', '-d',
+        classes_dir, _SERVER_SOURCE
+    ])
+
+
+def start_server(root, jdk_bin, threads=None):
+    if root is None or jdk_bin is None:
+        print('Warning: missing javac server root directory or jdk path')
+        return
+    root = os.path.realpath(root)
+    jdk_bin = os.path.realpath(jdk_bin)
+    classes_dir = os.path.join(root, 'classes')
+    port_file = os.path.join(root, '.port')
+    config_file = _config_file(root)
+    os.makedirs(root, exist_ok=True)
+    _build_server(jdk_bin, classes_dir)
+
+    if os.path.exists(port_file):
+        os.unlink(port_file)
+    cmd = [os.path.join(jdk_bin, 'java')] + _JVM_ARGS + [
+        '-cp', classes_dir, _SERVER_CLASS, port_file
+    ]
+    if threads:
+        cmd.append(str(threads))
+    # The token is handed over on stdin, where other users cannot read it,
+    # unlike the command line.
+    token = secrets.token_hex(32)
+    server = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+    server.stdin.write((token + '\n').encode())
+    server.stdin.close()
+    deadline = time.time() + _START_TIMEOUT
+    port = None
+    while port is None:
+        if server.poll() is not None or time.time() > deadline:
+            server.kill()
+            print('Warning: Failed to start javac server')
+            return
+        try:
+            with open(port_file, 'r') as f:
+                port = int(f.read())
+        except (OSError, ValueError):
+            time.sleep(0.1)
+
+    # Relative paths in javac arguments resolve against the server's
+    # working directory, so clients only use a server started in theirs.
+    config = {
+        'root': root,
+        'config_file': config_file,
+        'cwd': os.getcwd(),
+        'javac': os.path.realpath(os.path.join(jdk_bin, 'javac')),
+        'host': '127.0.0.1',
+        'port': port,
+        'token': token,
+    }
+    # The config holds the token, so only this user may read it.
+    fd = os.open(config_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    os.fchmod(fd, 0o600)
+    with os.fdopen(fd, 'w') as jsonfile:
+        json.dump(config, jsonfile, indent=2, sort_keys=True)
+    print('Starting javac server at {}:{}'.format(config['host'], port))
+    try:
+        server.wait()
+    finally:
+        os.unlink(config_file)
+
+
+def get_server_config(root=JAVAC_SERVER_DIR):
+    if root is None:
+        return None
+    try:
+        with open(_config_file(root), 'r') as jsonfile:
+            return json.load(jsonfile)
+    except (OSError, ValueError):
+        return None
+
+
+def stop_server(root):
+    config = get_server_config(root)
+    if config is None:
+        return
+    try:
+        conn = client.HTTPConnection(config['host'], config['port'])
+        conn.request('POST', '/stop',
+                     headers={_TOKEN_HEADER: config['token']})
+        conn.getresponse().read()
+        conn.close()
+    except:  # noqa: E722 pylint: disable=bare-except
+        pass
+
+
+def compile_java(javac_cmd):
+    """Runs |javac_cmd| in the javac server.
+
+    Returns (returncode, stdout, stderr), or None when no compatible server
+    is running and the caller must run javac itself.
+    """
+    config = get_server_config()
+    if config is None:
+        return None
+    if os.path.realpath(javac_cmd[0]) != config.get('javac'):
+        return None
+    if os.path.realpath(os.getcwd()) != os.path.realpath(config.get('cwd')):
+        return None
+    # Servers started before tokens existed refuse nothing, so skip them.
+    if not config.get('token'):
+        return None
+
+    # The server JVM has its own flags, so per-invocation -J options are
+    # dropped.
+    args = [arg for arg in javac_cmd[1:] if not arg.startswith('-J')]
+    body = '\0'.join(args).encode('utf-8')
+    try:
+        conn = client.HTTPConnection(config['host'], config['port'])
+        conn.request('POST',
+                     '/compile',
+                     body=body,
+                     headers={_TOKEN_HEADER: config['token']})
+        response = conn.getresponse()
+        data = response.read()
+        conn.close()
+        if response.status != 200:
+            return None
+        returncode, stdout_size, output = data.split(b'\n', 2)
+        stdout_size = int(stdout_size)
+        return (int(returncode), output[:stdout_size], output[stdout_size:])
+    except (OSError, ValueError, client.HTTPException):
+        return None
+
+
+def main(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--root',
+                        default=JAVAC_SERVER_DIR,
+                        help='path to javac server root directory')
+    parser.add_argument('--jdkpath', help='path to the jdk bin directory')
+    parser.add_argument('--threads',
+                        type=int,
+                        help='number of concurrent compilations')
+    parser.add_argument('--start',
+                        action='store_true',
+                        help='start the javac server in the current directory')
+    parser.add_argument('--stop',
+                        action='store_true',
+                        help='stop the javac server')
+
+    options = parser.parse_args(args)
+    if options.start:
+        start_server(options.root, options.jdkpath, options.threads)
+    if options.stop:
+        stop_server(options.root)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
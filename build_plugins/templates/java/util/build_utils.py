@@ -6,9 +6,12 @@
 """Contains common helpers for GN action()s."""
 
 import collections
+import concurrent.futures
 import contextlib
 import filecmp
 import fnmatch
+import functools
+import io
 import json
 import os
 import pipes
@@ -18,6 +21,7 @@ import stat
 import subprocess
 import sys
 import tempfile
+import threading
 import zipfile
 import optparse
 
@@ -26,6 +30,7 @@ import optparse
 
 # Some clients do not add //build_plugins/templates/java/util to PYTHONPATH.
 from . import md5_check  # pylint: disable=relative-import
+from . import zip_cache  # pylint: disable=relative-import
 
 sys.path.append(
     os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, os.pardir))
@@ -43,6 +48,15 @@ DIR_SOURCE_ROOT = os.environ.get(
 HERMETIC_TIMESTAMP = (2001, 1, 1, 0, 0, 0)
 _HERMETIC_FILE_ATTR = (0o644 << 16)
 
+# Archives with fewer regular files than this are extracted on one thread,
+# where opening extra ZipFile handles would cost more than it saves.
+_PARALLEL_EXTRACT_MIN_FILES = 64
+_EXTRACT_BUFFER_SIZE = 1024 * 1024
+
+# Entries up to this size are written with ZipFile.writestr(), which takes a
+# deflate level. Larger ones are streamed through ZipFile.open() instead.
+_WRITESTR_MAX_SIZE = 64 * 1024 * 1024
+
 
 @contextlib.contextmanager
 def temp_dir():
@@ -227,7 +241,29 @@ def check_output(args,
     child = subprocess.Popen(
         args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd, env=env)
     stdout, stderr = child.communicate()
-
+    return handle_process_output(args, cwd, child.returncode, stdout, stderr,
+                                 print_stdout=print_stdout,
+                                 print_stderr=print_stderr,
+                                 stdout_filter=stdout_filter,
+                                 stderr_filter=stderr_filter,
+                                 fail_func=fail_func)
+
+
+def handle_process_output(args,
+                          cwd,
+                          returncode,
+                          stdout,
+                          stderr,
+                          print_stdout=False,
+                          print_stderr=True,
+                          stdout_filter=None,
+                          stderr_filter=None,
+                          fail_func=lambda returncode, stderr: returncode != 0):
+    """Filters, checks and prints the output of a finished |args| run.
+
+    This is the second half of check_output(), for callers that ran the
+    command some other way.
+    """
     if stdout_filter is not None:
         stdout = stdout_filter(stdout)
 
@@ -238,7 +274,7 @@ def check_output(args,
     if isinstance(stderr, bytes):
         stderr = stderr.decode()
 
-    if fail_func(child.returncode, stderr):
+    if fail_func(returncode, stderr):
         raise called_process_error(cwd, args, stdout + stderr)
 
     if print_stdout:
@@ -254,6 +290,62 @@ def check_output(args,
     return stdout
 
 
+def check_output_streaming(args,
+                           cwd=None,
+                           env=None,
+                           print_stdout=False,
+                           print_stderr=True,
+                           stdout_line_filter=None,
+                           stderr_line_filter=None,
+                           fail_func=lambda returncode, stderr: returncode != 0):
+    """Runs |args| like check_output(), but handles its output line by line.
+
+    Lines are decoded, filtered and forwarded as soon as the process writes
+    them rather than once it exits. The line filters take a line without its
+    newline and return whether to keep it. Only kept lines are retained, for
+    |fail_func| and the returned stdout. Since output is forwarded before
+    |fail_func| decides, the called_process_error raised on failure only
+    carries the output that was not printed.
+    """
+    if not cwd:
+        cwd = os.getcwd()
+
+    child = subprocess.Popen(
+        args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd, env=env)
+
+    def pump(pipe, line_filter, out, kept):
+        for raw_line in iter(pipe.readline, b''):
+            line = raw_line.decode()
+            if line_filter is None or line_filter(line.rstrip('\n')):
+                kept.append(line)
+                if out is not None:
+                    out.write(line)
+                    out.flush()
+        pipe.close()
+
+    stdout_lines = []
+    stderr_lines = []
+    # Both pipes are drained at once so that neither can fill up and block
+    # the process.
+    stderr_thread = threading.Thread(
+        target=pump,
+        args=(child.stderr, stderr_line_filter,
+              sys.stderr if print_stderr else None, stderr_lines))
+    stderr_thread.start()
+    pump(child.stdout, stdout_line_filter,
+         sys.stdout if print_stdout else None, stdout_lines)
+    stderr_thread.join()
+    returncode = child.wait()
+
+    stdout = ''.join(stdout_lines)
+    stderr = ''.join(stderr_lines)
+    if fail_func(returncode, stderr):
+        unprinted = ('' if print_stdout else stdout) + (
+            '' if print_stderr else stderr)
+        raise called_process_error(cwd, args, unprinted)
+    return stdout
+
+
 def get_modified_time(path):
     # For a symlink, the modified time should be the greater of the link's
     # modified time and the modified time of the target.
@@ -278,56 +370,207 @@ def _check_zip_path(name):
         raise Exception('Absolute zip path: %s' % name)
 
 
-def _is_symlink(zip_file, name):
-    zi = zip_file.getinfo(name)
-
+def _is_symlink(zip_info):
     # The two high-order bytes of ZipInfo.external_attr represent
     # UNIX permissions and file type bits.
-    return stat.S_ISLNK(zi.external_attr >> 16)
+    return stat.S_ISLNK(zip_info.external_attr >> 16)
+
+
+def _extract_entries(zip_file, infos, path, replace_existing, open_lock):
+    """Extracts regular file |infos| of |zip_file| below |path|.
+
+    Several calls may share |zip_file| from different threads. zipfile
+    reference-counts its file handle without locking, so opening and closing
+    entries is serialized through |open_lock|; reading and decompressing run
+    concurrently. Parent directories must already exist.
+    """
+    for info in infos:
+        dest = os.path.join(path, info.filename)
+        if replace_existing and os.path.lexists(dest):
+            os.unlink(dest)
+        with open_lock:
+            src = zip_file.open(info)
+        try:
+            with open(dest, 'wb') as dst:
+                shutil.copyfileobj(src, dst, _EXTRACT_BUFFER_SIZE)
+        finally:
+            with open_lock:
+                src.close()
+
+
+def _zip_entry_equals_file(zip_file, info, path):
+    """Returns whether entry |info| of |zip_file| holds the bytes of |path|."""
+    with zip_file.open(info) as src, open(path, 'rb') as f:
+        while True:
+            expected = src.read(_EXTRACT_BUFFER_SIZE)
+            if not expected:
+                return not f.read(1)
+            if f.read(len(expected)) != expected:
+                return False
+
+
+def _link_or_copy(src, dest):
+    if os.path.lexists(dest):
+        os.unlink(dest)
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copyfile(src, dest)
 
 
 def extract_all(zip_path,
-               path=None,
-               no_clobber=True,
-               pattern=None,
-               predicate=None):
+                path=None,
+                no_clobber=True,
+                pattern=None,
+                predicate=None,
+                jobs=None,
+                hardlink_duplicates=False):
+    """Extracts files from |zip_path| into |path|.
+
+    Args:
+      zip_path: Path of the zip file to extract.
+      path: Destination directory. Defaults to the current directory.
+      no_clobber: Whether to fail when a destination file already exists.
+      pattern: Optional glob that entry names must match.
+      predicate: Optional function that returns whether to extract an entry.
+      jobs: Number of threads extracting regular files. They share the
+          ZipFile from zip_cache. Defaults to the CPU count for large archives.
+      hardlink_duplicates: Whether entries with identical content are written
+          once and hardlinked to their other destinations. Entries with the
+          same CRC and size are compared byte for byte before linking. Only
+          safe when the extracted files are not modified in place afterwards.
+    Returns:
+      The list of extracted paths, in archive order.
+    """
     if path is None:
         path = os.getcwd()
     elif not os.path.exists(path):
         make_directory(path)
 
-    if not zipfile.is_zipfile(zip_path):
+    try:
+        z = zip_cache.open_zip(zip_path)
+    except zipfile.BadZipFile:
         raise Exception('Invalid zip file: %s' % zip_path)
 
     extracted = []
-    with zipfile.ZipFile(zip_path) as z:
-        for name in z.namelist():
-            if name.endswith('/'):
-                make_directory(os.path.join(path, name))
+    dirs = set()
+    files = []
+    symlinks = []
+    for info in z.infolist():
+        name = info.filename
+        if name.endswith('/'):
+            dirs.add(os.path.join(path, name))
+            continue
+        if pattern is not None:
+            if not fnmatch.fnmatch(name, pattern):
                 continue
-            if pattern is not None:
-                if not fnmatch.fnmatch(name, pattern):
-                    continue
-            if predicate and not predicate(name):
+        if predicate and not predicate(name):
+            continue
+        _check_zip_path(name)
+        output_path = os.path.join(path, name)
+        if no_clobber:
+            if os.path.exists(output_path):
+                raise Exception('Path already exists from zip: %s %s %s' %
+                                (zip_path, name, output_path))
+        dirs.add(os.path.dirname(output_path))
+        extracted.append(output_path)
+        if _is_symlink(info):
+            symlinks.append((z.read(info), output_path))
+        else:
+            files.append(info)
+
+    for dir_path in sorted(dirs):
+        make_directory(dir_path)
+
+    duplicates = []
+    if hardlink_duplicates:
+        first_by_content = {}
+        unique_files = []
+        for info in files:
+            # ijar creates zips with null CRCs, which can't identify content.
+            if not info.CRC and info.file_size:
+                unique_files.append(info)
                 continue
-            _check_zip_path(name)
-            if no_clobber:
-                output_path = os.path.join(path, name)
-                if os.path.exists(output_path):
-                    raise Exception('Path already exists from zip: %s %s %s' %
-                                    (zip_path, name, output_path))
-            if _is_symlink(z, name):
-                dest = os.path.join(path, name)
-                make_directory(os.path.dirname(dest))
-                os.symlink(z.read(name), dest)
-                extracted.append(dest)
+            key = (info.CRC, info.file_size)
+            if key in first_by_content:
+                duplicates.append((first_by_content[key], info))
             else:
-                z.extract(name, path)
-                extracted.append(os.path.join(path, name))
+                first_by_content[key] = info
+                unique_files.append(info)
+        files = unique_files
+
+    if jobs is None:
+        jobs = 1
+        if len(files) >= _PARALLEL_EXTRACT_MIN_FILES:
+            jobs = os.cpu_count() or 1
+    jobs = max(1, min(jobs, len(files)))
+    open_lock = threading.Lock()
+    if jobs == 1:
+        _extract_entries(z, files, path, hardlink_duplicates, open_lock)
+    else:
+        with concurrent.futures.ThreadPoolExecutor(jobs) as pool:
+            chunks = [files[i::jobs] for i in range(jobs)]
+            for _ in pool.map(
+                    lambda chunk: _extract_entries(z, chunk, path,
+                                                   hardlink_duplicates,
+                                                   open_lock),
+                    chunks):
+                pass
+
+    for src_info, info in duplicates:
+        src_path = os.path.join(path, src_info.filename)
+        # Equal CRC and size can still be different content.
+        if _zip_entry_equals_file(z, info, src_path):
+            _link_or_copy(src_path, os.path.join(path, info.filename))
+        else:
+            _extract_entries(z, [info], path, True, open_lock)
+
+    for target, output_path in symlinks:
+        os.symlink(target, output_path)
 
     return extracted
 
 
+def _write_hermetic_entry(zip_file,
+                          zip_path,
+                          src,
+                          size,
+                          external_attr,
+                          compress=None,
+                          compress_level=None):
+    """Streams |size| bytes from the file object |src| into |zip_file|.
+
+    The size is known up front, so zipfile switches to Zip64 records by
+    itself when the entry needs them, without buffering the contents.
+
+    Only ZipFile.writestr() takes a deflate level before Python 3.13, so
+    |compress_level| is ignored for entries larger than _WRITESTR_MAX_SIZE
+    on older versions.
+    """
+    zipinfo = zipfile.ZipInfo(filename=zip_path, date_time=HERMETIC_TIMESTAMP)
+    zipinfo.external_attr = external_attr
+    zipinfo.file_size = size
+
+    # zipfile will deflate even when it makes the file bigger. To avoid
+    # growing files, disable compression at an arbitrary cut off point.
+    if size < 16:
+        compress = False
+
+    # None converts to ZIP_STORED, when passed explicitly rather than the
+    # default passed to the ZipFile constructor.
+    zipinfo.compress_type = zip_file.compression
+    if compress is not None:
+        zipinfo.compress_type = (zipfile.ZIP_DEFLATED
+                                 if compress else zipfile.ZIP_STORED)
+    if compress_level is not None and size <= _WRITESTR_MAX_SIZE:
+        zip_file.writestr(zipinfo, src.read(), compresslevel=compress_level)
+        return
+    if compress_level is not None and hasattr(zipinfo, 'compress_level'):
+        zipinfo.compress_level = compress_level
+    with zip_file.open(zipinfo, 'w') as dst:
+        shutil.copyfileobj(src, dst, _EXTRACT_BUFFER_SIZE)
+
+
 def add_to_zip_hermetic(zip_file,
                      zip_path,
                      src_path=None,
@@ -362,22 +605,25 @@ def add_to_zip_hermetic(zip_file,
         for mode in (stat.S_IXUSR, stat.S_IXGRP, stat.S_IXOTH):
             if st.st_mode & mode:
                 zipinfo.external_attr |= mode << 16
-
-    if src_path:
+        # Stream the file rather than reading it into memory, so entries
+        # larger than RAM (or 4 GiB) can be added.
         with open(src_path, 'rb') as f:
-            data = f.read()
+            _write_hermetic_entry(zip_file,
+                                  zip_path,
+                                  f,
+                                  st.st_size,
+                                  zipinfo.external_attr,
+                                  compress=compress)
+        return
 
-    # zipfile will deflate even when it makes the file bigger. To avoid
-    # growing files, disable compression at an arbitrary cut off point.
-    if len(data) < 16:
-        compress = False
-
-    # None converts to ZIP_STORED, when passed explicitly rather than the
-    # default passed to the ZipFile constructor.
-    compress_type = zip_file.compression
-    if compress is not None:
-        compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
-    zip_file.writestr(zipinfo, data, compress_type)
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    _write_hermetic_entry(zip_file,
+                          zip_path,
+                          io.BytesIO(data),
+                          len(data),
+                          zipinfo.external_attr,
+                          compress=compress)
 
 
 def do_zip(inputs, output, base_dir=None, compress_fn=None,
@@ -386,7 +632,7 @@ def do_zip(inputs, output, base_dir=None, compress_fn=None,
 
     Args:
       inputs: A list of paths to zip, or a list of (zip_path, fs_path) tuples.
-      output: Destination .zip file.
+      output: Destination .zip file, or ZipFile instance to add files to.
       base_dir: Prefix to strip from inputs.
       compress_fn: Applied to each input to determine whether or not to compress.
           By default, items will be |zipfile.ZIP_STORED|.
@@ -400,13 +646,23 @@ def do_zip(inputs, output, base_dir=None, compress_fn=None,
 
     # Sort by zip path to ensure stable zip ordering.
     input_tuples.sort(key=lambda tup: tup[0])
-    with zipfile.ZipFile(output, 'w') as outfile:
+
+    output_is_already_open = isinstance(output, zipfile.ZipFile)
+    if output_is_already_open:
+        outfile = output
+    else:
+        outfile = zipfile.ZipFile(output, 'w', allowZip64=True)
+
+    try:
         for zip_path, fs_path in input_tuples:
             if zip_prefix_path:
                 zip_path = os.path.join(zip_prefix_path, zip_path)
             compress = compress_fn(zip_path) if compress_fn else None
             add_to_zip_hermetic(outfile, zip_path, src_path=fs_path,
                              compress=compress)
+    finally:
+        if not output_is_already_open:
+            outfile.close()
 
 
 def zip_dir(output, base_dir, compress_fn=None, zip_prefix_path=None):
@@ -425,22 +681,38 @@ def zip_dir(output, base_dir, compress_fn=None, zip_prefix_path=None):
             zip_prefix_path=zip_prefix_path)
 
 
+@functools.lru_cache(maxsize=64)
+def _compile_glob_tuple(filters):
+    if not filters:
+        return lambda path: False
+    regex = re.compile('|'.join(
+        '(?:{})'.format(fnmatch.translate(f)) for f in filters))
+    return lambda path: regex.match(path) is not None
+
+
+def compile_globs(filters):
+    """Returns a function that tells whether a path matches any of |filters|.
+
+    All glob patterns are folded into a single regular expression, so the cost
+    of a lookup does not grow with the number of patterns.
+    """
+    return _compile_glob_tuple(tuple(filters or ()))
+
+
 def matches_glob(path, filters):
     """Returns whether the given path matches any of the given glob patterns."""
-    return filters and any(fnmatch.fnmatch(path, f) for f in filters)
+    return bool(filters) and compile_globs(filters)(path)
 
 
-def _strip_dst_name(dst_name, options):
+def _create_strip_matcher(options):
+    """Returns a function telling whether merge_zips() should drop a path."""
     # Strip specific directories and file if options is not None
+    patterns = []
     if options and options.stripFile:
-        for f in options.stripFile:
-            if fnmatch.fnmatch(dst_name, '*/' + f):
-                return True
+        patterns.extend('*/' + f for f in options.stripFile)
     if options and options.stripDir:
-        for d in options.stripDir:
-            if fnmatch.fnmatch(dst_name, d + '/*'):
-                return True
-    return False
+        patterns.extend(d + '/*' for d in options.stripDir)
+    return compile_globs(patterns)
 
 
 def merge_zips(output, input_zips, path_transform=None, merge_args=None):
@@ -464,6 +736,7 @@ def merge_zips(output, input_zips, path_transform=None, merge_args=None):
         options, _ = parser.parse_args(args)
 
     path_transform = path_transform or (lambda p: p)
+    is_stripped = _create_strip_matcher(options)
     added_names = set()
 
     output_is_already_open = not isinstance(output, str)
@@ -471,30 +744,34 @@ def merge_zips(output, input_zips, path_transform=None, merge_args=None):
         assert isinstance(output, zipfile.ZipFile)
         out_zip = output
     else:
-        out_zip = zipfile.ZipFile(output, 'w')
+        out_zip = zipfile.ZipFile(output, 'w', allowZip64=True)
 
     try:
         for in_file in input_zips:
-            with zipfile.ZipFile(in_file, 'r') as in_zip:
-                # ijar creates zips with null CRCs.
-                in_zip._expected_crc = None
-                for info in in_zip.infolist():
-                    # Ignore directories.
-                    if info.filename[-1] == '/':
-                        continue
-                    dst_name = path_transform(info.filename)
-                    if not dst_name:
-                        continue
-                    if _strip_dst_name(dst_name, options):
-                        continue
-                    already_added = dst_name in added_names
-                    if not already_added:
-                        add_to_zip_hermetic(
+            in_zip = zip_cache.open_zip(in_file)
+            # ijar creates zips with null CRCs.
+            in_zip._expected_crc = None
+            for info in in_zip.infolist():
+                # Ignore directories.
+                if info.filename[-1] == '/':
+                    continue
+                dst_name = path_transform(info.filename)
+                if not dst_name:
+                    continue
+                if is_stripped(dst_name):
+                    continue
+                already_added = dst_name in added_names
+                if not already_added:
+                    _check_zip_path(dst_name)
+                    with in_zip.open(info) as src:
+                        _write_hermetic_entry(
                             out_zip,
                             dst_name,
-                            data=in_zip.read(info),
+                            src,
+                            info.file_size,
+                            _HERMETIC_FILE_ATTR,
                             compress=info.compress_type != zipfile.ZIP_STORED)
-                        added_names.add(dst_name)
+                    added_names.add(dst_name)
     finally:
         if not output_is_already_open:
             out_zip.close()
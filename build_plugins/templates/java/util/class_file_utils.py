@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026 Huawei Device Co., Ltd.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Utilities to read the parts of .class files that matter to incremental
+# javac: which classes a class refers to, and its ABI, i.e. everything
+# another class can be compiled against. Method bodies, private members
+# and synthetic members are not part of the ABI.
+
+import collections
+import hashlib
+import json
+import os
+import re
+import struct
+
+from . import build_utils
+from . import zip_cache
+
+_CONSTANT_UTF8 = 1
+_CONSTANT_INTEGER = 3
+_CONSTANT_FLOAT = 4
+_CONSTANT_LONG = 5
+_CONSTANT_DOUBLE = 6
+_CONSTANT_CLASS = 7
+_CONSTANT_STRING = 8
+
+# Sizes of the constant pool entries that are skipped, by tag.
+_CONSTANT_SIZES = {
+    9: 4,  # Fieldref
+    10: 4,  # Methodref
+    11: 4,  # InterfaceMethodref
+    12: 4,  # NameAndType
+    15: 3,  # MethodHandle
+    16: 2,  # MethodType
+    17: 4,  # Dynamic
+    18: 4,  # InvokeDynamic
+    19: 2,  # Module
+    20: 2,  # Package
+}
+
+_ACC_PRIVATE = 0x0002
+_ACC_SYNTHETIC = 0x1000
+# ACC_SUPER on classes; ACC_SYNCHRONIZED, ACC_NATIVE and ACC_STRICT on
+# methods. None of them changes how callers are compiled.
+_CLASS_FLAGS_MASK = ~0x0020
+_METHOD_FLAGS_MASK = ~(0x0020 | 0x0100 | 0x0800)
+
+# Class names inside descriptors and generic signatures.
+_DESCRIPTOR_CLASS_RE = re.compile(r'L([^;<>\[\s.]+)[;<]')
+
+ClassInfo = collections.namedtuple('ClassInfo', [
+    'name',  # Internal name, e.g. 'org/ohos/Foo$Bar'.
+    'super_name',
+    'interfaces',
+    'referenced_classes',  # frozenset of internal names.
+    'abi',  # Hex digest, or None if no other class can refer to it.
+    'constants',  # {field name: value} of non-private constant fields.
+])
+
+
+def top_level_class_name(name):
+    """Returns the fully qualified name of the top-level class of |name|."""
+    return name.split('$', 1)[0].replace('/', '.')
+
+
+class _ClassReader(object):
+    def __init__(self, data):
+        self._data = data
+        self._offset = 0
+        self._pool = [None]
+
+    def u1(self):
+        value = self._data[self._offset]
+        self._offset += 1
+        return value
+
+    def u2(self):
+        value, = struct.unpack_from('>H', self._data, self._offset)
+        self._offset += 2
+        return value
+
+    def u4(self):
+        value, = struct.unpack_from('>I', self._data, self._offset)
+        self._offset += 4
+        return value
+
+    def skip(self, size):
+        self._offset += size
+
+    def read_constant_pool(self):
+        count = self.u2()
+        while len(self._pool) < count:
+            tag = self.u1()
+            if tag == _CONSTANT_UTF8:
+                size = self.u2()
+                raw = self._data[self._offset:self._offset + size]
+                self._offset += size
+                self._pool.append((tag, raw.decode('utf-8', 'replace')))
+            elif tag in (_CONSTANT_INTEGER, _CONSTANT_FLOAT):
+                fmt = '>i' if tag == _CONSTANT_INTEGER else '>f'
+                value, = struct.unpack_from(fmt, self._data, self._offset)
+                self._offset += 4
+                self._pool.append((tag, value))
+            elif tag in (_CONSTANT_LONG, _CONSTANT_DOUBLE):
+                fmt = '>q' if tag == _CONSTANT_LONG else '>d'
+                value, = struct.unpack_from(fmt, self._data, self._offset)
+                self._offset += 8
+                # 8-byte constants take up two slots.
+                self._pool.extend([(tag, value), None])
+            elif tag in (_CONSTANT_CLASS, _CONSTANT_STRING):
+                self._pool.append((tag, self.u2()))
+            elif tag in _CONSTANT_SIZES:
+                self.skip(_CONSTANT_SIZES[tag])
+                self._pool.append((tag, None))
+            else:
+                raise Exception('Unknown constant pool tag {}'.format(tag))
+
+    def utf8(self, index):
+        return self._pool[index][1] if index else None
+
+    def class_name(self, index):
+        return self.utf8(self._pool[index][1]) if index else None
+
+    def constant(self, index):
+        tag, value = self._pool[index]
+        if tag in (_CONSTANT_CLASS, _CONSTANT_STRING):
+            value = self.utf8(value)
+        return '{}:{!r}'.format(tag, value)
+
+    def iter_class_references(self):
+        for entry in self._pool:
+            if entry is None:
+                continue
+            tag, value = entry
+            if tag == _CONSTANT_CLASS:
+                name = self.utf8(value)
+                # Array classes are named by their descriptor.
+                if name.startswith('['):
+                    for match in _DESCRIPTOR_CLASS_RE.finditer(name):
+                        yield match.group(1)
+                else:
+                    yield name
+            elif tag == _CONSTANT_UTF8 and 'L' in value:
+                for match in _DESCRIPTOR_CLASS_RE.finditer(value):
+                    yield match.group(1)
+
+    def element_value(self):
+        tag = chr(self.u1())
+        if tag in 'BCDFIJSZs':
+            return self.constant(self.u2())
+        if tag == 'e':
+            return '{}.{}'.format(self.utf8(self.u2()), self.utf8(self.u2()))
+        if tag == 'c':
+            return self.utf8(self.u2())
+        if tag == '@':
+            return self.annotation()
+        if tag == '[':
+            return '[{}]'.format(','.join(
+                self.element_value() for _ in range(self.u2())))
+        raise Exception('Unknown annotation element tag {}'.format(tag))
+
+    def annotation(self):
+        type_name = self.utf8(self.u2())
+        pairs = []
+        for _ in range(self.u2()):
+            pairs.append('{}={}'.format(self.utf8(self.u2()),
+                                        self.element_value()))
+        return '@{}({})'.format(type_name, ','.join(pairs))
+
+    def attributes(self):
+        """Returns the ABI-relevant attributes as {name: string}.
+
+        Also returns the raw inner class table for class attributes.
+        """
+        abi = {}
+        inner_classes = []
+        for _ in range(self.u2()):
+            name = self.utf8(self.u2())
+            size = self.u4()
+            end = self._offset + size
+            if name == 'Signature':
+                abi[name] = self.utf8(self.u2())
+            elif name == 'ConstantValue':
+                abi[name] = self.constant(self.u2())
+            elif name == 'Exceptions':
+                abi[name] = ','.join(
+                    self.class_name(self.u2()) for _ in range(self.u2()))
+            elif name == 'Deprecated':
+                abi[name] = ''
+            elif name == 'AnnotationDefault':
+                abi[name] = self.element_value()
+            elif name in ('RuntimeVisibleAnnotations',
+                          'RuntimeInvisibleAnnotations'):
+                abi[name] = ','.join(
+                    sorted(self.annotation() for _ in range(self.u2())))
+            elif name == 'InnerClasses':
+                for _ in range(self.u2()):
+                    inner_classes.append((self.class_name(self.u2()),
+                                          self.class_name(self.u2()),
+                                          self.utf8(self.u2()), self.u2()))
+            self._offset = end
+        return abi, inner_classes
+
+    def members(self, flags_mask):
+        """Returns ABI lines and constants of the fields or methods."""
+        lines = []
+        constants = {}
+        for _ in range(self.u2()):
+            flags = self.u2()
+            name = self.utf8(self.u2())
+            descriptor = self.utf8(self.u2())
+            attributes, _ = self.attributes()
+            if flags & (_ACC_PRIVATE | _ACC_SYNTHETIC):
+                continue
+            if 'ConstantValue' in attributes:
+                constants[name] = attributes['ConstantValue']
+            lines.append('{:x} {} {} {}'.format(
+                flags & flags_mask, name, descriptor,
+                sorted(attributes.items())))
+        return sorted(lines), constants
+
+
+def read_class_file(data):
+    """Parses the bytes of a .class file into a ClassInfo."""
+    reader = _ClassReader(data)
+    if reader.u4() != 0xCAFEBABE:
+        raise Exception('Not a class file')
+    reader.skip(4)  # minor_version, major_version
+    reader.read_constant_pool()
+    flags = reader.u2()
+    name = reader.class_name(reader.u2())
+    super_name = reader.class_name(reader.u2())
+    interfaces = tuple(
+        reader.class_name(reader.u2()) for _ in range(reader.u2()))
+    fields, constants = reader.members(-1)
+    methods, _ = reader.members(_METHOD_FLAGS_MASK)
+    attributes, inner_classes = reader.attributes()
+
+    visible = True
+    inner_class_lines = []
+    for inner, outer, inner_name, inner_flags in inner_classes:
+        if inner == name and (inner_flags & _ACC_PRIVATE or outer is None
+                              or inner_name is None):
+            # Private, local and anonymous classes are implementation.
+            visible = False
+        if (inner == name or outer == name) and not inner_flags & _ACC_PRIVATE:
+            inner_class_lines.append('{} {} {} {:x}'.format(
+                inner, outer, inner_name, inner_flags))
+
+    abi = None
+    if visible:
+        lines = ['{:x} {} {} {}'.format(flags & _CLASS_FLAGS_MASK, name,
+                                        super_name, interfaces),
+                 str(sorted(attributes.items()))]
+        lines.extend(sorted(inner_class_lines))
+        lines.extend(fields)
+        lines.extend(methods)
+        abi = hashlib.sha256('\n'.join(lines).encode('utf-8')).hexdigest()
+
+    referenced = set(reader.iter_class_references())
+    referenced.discard(name)
+    return ClassInfo(name, super_name, interfaces, frozenset(referenced), abi,
+                     constants)
+
+
+def read_jar_classes(jar_path):
+    """Returns {internal name: ClassInfo} for every class in |jar_path|."""
+    classes = {}
+    z = zip_cache.open_zip(jar_path)
+    for info in z.infolist():
+        if info.filename.endswith('.class'):
+            class_info = read_class_file(z.read(info))
+            classes[class_info.name] = class_info
+    return classes
+
+
+def jar_abi_fingerprint(jar_path):
+    """Returns a digest of the ABI of all classes in |jar_path|.
+
+    It only changes when code compiled against the jar might compile
+    differently, not when method bodies or private members change.
+    """
+    digest = hashlib.sha256()
+    classes = read_jar_classes(jar_path)
+    for name in sorted(classes):
+        abi = classes[name].abi
+        if abi is not None:
+            digest.update('{} {}\n'.format(name, abi).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def jar_abi_fingerprints(jar_paths, cache_path=None):
+    """Returns {jar path: jar_abi_fingerprint()} for |jar_paths|.
+
+    Fingerprints stored in |cache_path| are reused for jars whose size and
+    mtime did not change, so unchanged jars are only stat()ed. The cache is
+    then rewritten with the fingerprints of |jar_paths|.
+    """
+    cache = {}
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'r') as f:
+                cache = json.load(f)
+        except ValueError:
+            pass
+
+    fingerprints = {}
+    new_cache = {}
+    for jar_path in jar_paths:
+        st = os.stat(jar_path)
+        key = [st.st_size, st.st_mtime_ns]
+        entry = cache.get(jar_path)
+        if entry is None or entry['key'] != key:
+            entry = {'key': key, 'fingerprint': jar_abi_fingerprint(jar_path)}
+        new_cache[jar_path] = entry
+        fingerprints[jar_path] = entry['fingerprint']
+
+    if cache_path:
+        with build_utils.atomic_output(cache_path) as f:
+            f.write(json.dumps(new_cache, sort_keys=True).encode())
+    return fingerprints
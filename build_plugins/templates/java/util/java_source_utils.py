@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026 Huawei Device Co., Ltd.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Utilities to scan .java files for their package, top-level classes and
+# imports.
+#
+# Not exactly a proper parser, but works for the sources we build: only
+# unindented lines are considered, so nested classes are not matched, and
+# comments are only stripped at the start of a line.
+
+import collections
+import concurrent.futures
+import hashlib
+import math
+import multiprocessing
+import os
+import re
+
+# Considers a leading * as a continuation of a multi-line comment (our
+# linter doesn't enforce a space before it like there should be).
+_COMMENT_RE = re.compile(r'^(?://.*|/?\*.*?(?:\*/\s*|$))')
+_PACKAGE_RE = re.compile(r'package\s+(.*?);')
+_IMPORT_RE = re.compile(r'import\s+(static)*\s*(.*?);')
+_CLASS_RE = re.compile(r'(?:\S.*?)?(?:class|@?interface|enum)\s+(.+?)\b')
+
+# Workers are spawned rather than forked, since callers scan from background
+# threads. A spawned worker re-imports the build script, which takes a few
+# hundred milliseconds, so below this many sources scanning inline is faster.
+_PARALLEL_SCAN_MIN_FILES = 4096
+
+JavaSource = collections.namedtuple('JavaSource',
+                                    ['package_name', 'class_names', 'imports'])
+
+# Scan results by content digest. Sources are often scanned more than once
+# per build, e.g. when extracted from a srcjar and again for the .jar.info.
+_scan_cache = {}
+
+
+def _scan(contents):
+    package_name = ''
+    class_names = []
+    imports = []
+    # Same line splitting as reading the file in text mode.
+    contents = contents.replace('\r\n', '\n').replace('\r', '\n')
+    for line in contents.split('\n'):
+        if line[:1] in ('/', '*'):
+            line = _COMMENT_RE.sub('', line, count=1)
+        # None of the patterns can match an empty or indented line.
+        if not line or line[0].isspace():
+            continue
+
+        if not package_name:
+            m = _PACKAGE_RE.match(line)
+            if m:
+                package_name = m.group(1)
+        m = _IMPORT_RE.match(line)
+        if m:
+            imports.append(m.group(2))
+        m = _CLASS_RE.match(line)
+        if m:
+            class_names.append(m.group(1))
+    return JavaSource(package_name, tuple(class_names), tuple(imports))
+
+
+def parse_java_source(java_file):
+    """Returns the JavaSource of |java_file|.
+
+    Files are read once and each distinct content is only scanned once.
+    """
+    with open(java_file, 'rb') as f:
+        data = f.read()
+    return parse_java_source_contents(data)
+
+
+def parse_java_source_contents(data):
+    """Returns the JavaSource for the bytes of a .java file."""
+    key = hashlib.sha1(data).digest()
+    result = _scan_cache.get(key)
+    if result is None:
+        result = _scan(data.decode('utf-8', 'replace'))
+        _scan_cache[key] = result
+    return result
+
+
+def _scan_contents(datas):
+    return [_scan(data.decode('utf-8', 'replace')) for data in datas]
+
+
+def parse_java_sources(java_files, jobs=None):
+    """Returns {path: JavaSource} for |java_files|.
+
+    Each file is read once. Sources whose content was already scanned in this
+    process are not scanned again. The rest are split across |jobs| spawned
+    worker processes when there are enough of them.
+    """
+    results = {}
+    missing = []
+    for java_file in java_files:
+        with open(java_file, 'rb') as f:
+            data = f.read()
+        key = hashlib.sha1(data).digest()
+        result = _scan_cache.get(key)
+        if result is None:
+            missing.append((java_file, key, data))
+        else:
+            results[java_file] = result
+
+    jobs = jobs or os.cpu_count() or 1
+    if jobs < 2 or len(missing) < _PARALLEL_SCAN_MIN_FILES:
+        for java_file, key, data in missing:
+            result = _scan_cache.get(key)
+            if result is None:
+                result = _scan(data.decode('utf-8', 'replace'))
+                _scan_cache[key] = result
+            results[java_file] = result
+        return results
+
+    chunk_size = int(math.ceil(len(missing) / float(jobs)))
+    chunks = [
+        missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size)
+    ]
+    with concurrent.futures.ProcessPoolExecutor(
+            len(chunks),
+            mp_context=multiprocessing.get_context('spawn')) as executor:
+        scans = executor.map(_scan_contents,
+                             [[data for _, _, data in c] for c in chunks])
+        for chunk, scanned in zip(chunks, scans):
+            for (java_file, key, _), result in zip(chunk, scanned):
+                _scan_cache[key] = result
+                results[java_file] = result
+    return results
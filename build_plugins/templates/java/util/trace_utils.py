@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026 Huawei Device Co., Ltd.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Optional phase timing for the java build actions.
+#
+# When JAVA_BUILD_TRACE_DIR is set, every action records how long its phases
+# take and writes them to JAVA_BUILD_TRACE_DIR/<target>.trace.json in the
+# Chrome trace-event format. Timestamps are wall-clock and each action has
+# its own pid, so the traceEvents of a whole build can be concatenated into
+# one file and loaded in chrome://tracing or Perfetto.
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+TRACE_DIR = os.environ.get('JAVA_BUILD_TRACE_DIR')
+
+_events = []
+_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def phase(name, **args):
+    """Records the time spent in the with-block as phase |name|.
+
+    |args| are shown with the phase in the trace viewer.
+    """
+    if TRACE_DIR is None:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        record(name, start, time.time(), **args)
+
+
+def record(name, start, end, **args):
+    """Records phase |name| from |start| to |end|, as given by time.time().
+
+    For phases that are only known to have happened once they are over.
+    """
+    if TRACE_DIR is None:
+        return
+    event = {
+        'name': name,
+        'cat': 'java',
+        'ph': 'X',
+        'ts': int(start * 1e6),
+        'dur': int((end - start) * 1e6),
+        'pid': os.getpid(),
+        'tid': threading.get_ident(),
+        'args': args,
+    }
+    with _lock:
+        _events.append(event)
+
+
+def write_trace(target):
+    """Writes the phases recorded so far as the trace of |target|.
+
+    |target| is usually the main output path of the action.
+    """
+    if TRACE_DIR is None or not _events:
+        return
+    os.makedirs(TRACE_DIR, exist_ok=True)
+    name = os.path.normpath(target).replace(os.sep, '_').lstrip('._')
+    metadata = {
+        'name': 'process_name',
+        'ph': 'M',
+        'pid': os.getpid(),
+        'args': {
+            'name': target
+        },
+    }
+    with _lock:
+        events = [metadata] + _events
+    with open(os.path.join(TRACE_DIR, name + '.trace.json'), 'w') as f:
+        json.dump({'traceEvents': events}, f)
@@ -82,6 +82,18 @@ all *direct* dependencies of the current target.
     script can use chains of `deps_configs` to compute transitive dependencies
     for each target when needed.
 
+* `deps_info['closure']`: The transitive dependencies of the current target,
+so that dependents do not have to follow chains of `deps_configs`.
+`closure['deps_configs']` lists the paths to their `.build_config` files in
+dependency order, ending with the current target itself.
+`closure['types']` maps each target type to the indices of the entries of
+that type in `closure['deps_configs']`.
+
+    NOTE: Each `.build_config` is written along with a `.build_config.summary`
+    file, holding its `deps_info` without the keys that list something for
+    every transitive dependency. Dependents read those instead of the
+    `.build_config` files of their indirect dependencies.
+
 ## Optional keys in `deps_info`:
 
 The following keys will only appear in the `.build_config` files of certain
@@ -506,6 +518,7 @@ This type corresponds to an AOSP app bundle (`.aab` file).
 --------------- END_MARKDOWN ---------------------------------------------------
 """
 
+import collections
 import itertools
 import json
 import optparse
@@ -579,6 +592,61 @@ class AndroidManifest(object):
     return self.manifest.getAttribute('package')
 
 
+class _PathList(object):
+  """An ordered list of paths with constant-time membership tests.
+
+  Classpaths and similar lists are built by appending the paths of every
+  transitive dependency that are not in the list yet. Doing that with plain
+  lists is quadratic in the number of libraries.
+
+  |paths| is extended in place, so it may be a list that is already part of
+  the config.
+  """
+
+  def __init__(self, paths=None):
+    self.paths = [] if paths is None else paths
+    self._members = set(self.paths)
+
+  def __contains__(self, path):
+    return path in self._members
+
+  def __iter__(self):
+    return iter(self.paths)
+
+  def Append(self, path):
+    self.paths.append(path)
+    self._members.add(path)
+
+  def Extend(self, paths):
+    """Appends all of |paths|, whether they are already listed or not."""
+    for path in paths:
+      self.Append(path)
+
+  def ExtendMissing(self, paths):
+    """Appends the paths from |paths| that are not listed yet."""
+    for path in paths:
+      if path not in self._members:
+        self.Append(path)
+
+
+# deps_info keys that hold a list entry per transitive dependency. Summaries
+# leave them out, which keeps them small.
+_TRANSITIVE_KEYS = (
+    'closure',
+    'dex_deps_interface_jar_path',
+    'dex_deps_jar_path',
+    'java_runtime_classpath',
+    'javac_full_classpath',
+    'javac_full_interface_classpath',
+    'proguard_all_configs',
+    'proguard_classpath_jars',
+)
+
+
+def _SummaryPath(build_config_path):
+  return build_config_path + '.summary'
+
+
 dep_config_cache = {}
 
 
@@ -589,39 +657,131 @@ def GetDepConfig(path):
   return dep_config_cache[path]
 
 
+dep_summary_cache = {}
+
+
+def GetDepSummary(path):
+  """Returns the deps_info of |path|, possibly without _TRANSITIVE_KEYS.
+
+  Deps.All() uses this, so that the build_configs of indirect dependencies,
+  which are much bigger than their summaries, are never loaded.
+  """
+  if path in dep_config_cache:
+    return dep_config_cache[path]
+  if path not in dep_summary_cache:
+    summary_path = _SummaryPath(path)
+    if not os.path.exists(summary_path):
+      return GetDepConfig(path)
+    with open(summary_path) as jsonfile:
+      dep_summary_cache[path] = json.load(jsonfile)
+  return dep_summary_cache[path]
+
+
+def _TypesOf(config_type):
+  """Returns the types that a config of |config_type| is listed under."""
+  if config_type == "ohos_maple_jar2so":
+    return (config_type, "java_library")
+  return (config_type,)
+
+
 def DepsOfType(wanted_type, configs):
-  if wanted_type == "java_library":
-    return [c for c in configs
-            if c['type'] == wanted_type or c['type'] == "ohos_maple_jar2so"]
-  else:
-    return [c for c in configs if c['type'] == wanted_type]
+  return [c for c in configs if wanted_type in _TypesOf(c['type'])]
+
+
+def _GetClosure(path):
+  """Returns the transitive closure stored in the build_config at |path|.
+
+  Returns:
+    None if the build_config was written without a closure. Otherwise,
+    a list of (path, type) tuples for all transitive dependencies of |path|
+    in the order of build_utils.get_sorted_transitive_dependencies(),
+    followed by |path| itself.
+  """
+  closure = GetDepConfig(path).get('closure')
+  if closure is None:
+    return None
+  paths = closure['deps_configs']
+  types = [None] * len(paths)
+  for config_type, indices in closure['types'].items():
+    for i in indices:
+      types[i] = config_type
+  return list(zip(paths, types))
 
 
 def GetAllDepsConfigsInOrder(deps_config_paths):
-  def GetDeps(path):
-    return GetDepConfig(path)['deps_configs']
-  return build_utils.get_sorted_transitive_dependencies(deps_config_paths, GetDeps)
+  """Returns the transitive deps of |deps_config_paths| as {path: type}.
+
+  Merges the closures of |deps_config_paths| rather than walking the graph.
+  The result is in the same order as walking it depth-first: each closure
+  ends with its own target, and everything it shares with an earlier
+  closure was already visited as part of that one.
+  """
+  ret = collections.OrderedDict()
+  for path in deps_config_paths:
+    # Everything a dep depends on was merged along with it.
+    if path in ret:
+      continue
+    closure = _GetClosure(path)
+    if closure is None:
+      # Written by an older version of this script, walk the graph instead.
+      def GetDeps(p):
+        return GetDepConfig(p)['deps_configs']
+      all_paths = build_utils.get_sorted_transitive_dependencies(
+          deps_config_paths, GetDeps)
+      return collections.OrderedDict(
+          (p, GetDepConfig(p)['type']) for p in all_paths)
+    for p, config_type in closure:
+      if p not in ret:
+        ret[p] = config_type
+  return ret
+
+
+def _CreateClosure(build_config_path, target_type, deps_config_paths):
+  """Returns the value of deps_info['closure'] for a target."""
+  closure = GetAllDepsConfigsInOrder(deps_config_paths)
+  closure[build_config_path] = target_type
+  types = {}
+  for i, config_type in enumerate(closure.values()):
+    types.setdefault(config_type, []).append(i)
+  return {'deps_configs': list(closure), 'types': types}
 
 
 class Deps(object):
+  """The direct and transitive dependencies of a target.
+
+  Lists returned by All() and Direct() are shared between calls and must not
+  be modified.
+  """
+
   def __init__(self, direct_deps_config_paths):
-    self.all_deps_config_paths = GetAllDepsConfigsInOrder(
-        direct_deps_config_paths)
+    self.all_deps_types = GetAllDepsConfigsInOrder(direct_deps_config_paths)
+    self.all_deps_config_paths = list(self.all_deps_types)
     self.direct_deps_configs = [
         GetDepConfig(p) for p in direct_deps_config_paths]
-    self.all_deps_configs = [
-        GetDepConfig(p) for p in self.all_deps_config_paths]
     self.direct_deps_config_paths = direct_deps_config_paths
 
+    # Paths of all deps by type, in dependency order. None lists all of them.
+    self._all_paths_by_type = {None: self.all_deps_config_paths}
+    for path, config_type in self.all_deps_types.items():
+      for t in _TypesOf(config_type):
+        self._all_paths_by_type.setdefault(t, []).append(path)
+    # Configs for _all_paths_by_type, loaded the first time a type is needed.
+    self._all_configs_by_type = {}
+    self._direct_configs_by_type = {None: self.direct_deps_configs}
+    for config in self.direct_deps_configs:
+      for t in _TypesOf(config['type']):
+        self._direct_configs_by_type.setdefault(t, []).append(config)
+
   def All(self, wanted_type=None):
-    if type is None:
-      return self.all_deps_configs
-    return DepsOfType(wanted_type, self.all_deps_configs)
+    configs = self._all_configs_by_type.get(wanted_type)
+    if configs is None:
+      configs = [GetDepSummary(p)
+                 for p in self._all_paths_by_type.get(wanted_type, [])]
+      self._all_configs_by_type[wanted_type] = configs
+    return configs
 
   def Direct(self, wanted_type=None):
-    if wanted_type is None:
-      return self.direct_deps_configs
-    return DepsOfType(wanted_type, self.direct_deps_configs)
+    return self._direct_configs_by_type.get(wanted_type, [])
 
   def AllConfigPaths(self):
     return self.all_deps_config_paths
@@ -629,8 +789,13 @@ class Deps(object):
   def RemoveNonDirectDep(self, path):
     if path in self.direct_deps_config_paths:
       raise Exception('Cannot remove direct dep.')
-    self.all_deps_config_paths.remove(path)
-    self.all_deps_configs.remove(GetDepConfig(path))
+    config_type = self.all_deps_types.pop(path)
+    for t in (None,) + _TypesOf(config_type):
+      paths = self._all_paths_by_type[t]
+      index = paths.index(path)
+      del paths[index]
+      if t in self._all_configs_by_type:
+        del self._all_configs_by_type[t][index]
 
   def GradlePrebuiltJarPaths(self):
     ret = []
@@ -1061,19 +1226,21 @@ def main(argv):
     tested_app_name = tested_app_deps.Direct()[0]['name']
     tested_app_resources_deps = tested_app_deps.All('aosp_resources')
     gradle['app_under_test'] = tested_app_name
-    all_resources_deps = [
-        d for d in all_resources_deps if d not in tested_app_resources_deps]
+    tested_app_resources_paths = set(
+        d['path'] for d in tested_app_resources_deps)
+    all_resources_deps = [d for d in all_resources_deps
+                          if d['path'] not in tested_app_resources_paths]
 
   # Required for generating gradle files.
   if options.type == 'java_library':
     deps_info['is_prebuilt'] = bool(options.is_prebuilt)
     deps_info['gradle_treat_as_prebuilt'] = options.gradle_treat_as_prebuilt
-    deps_info['deps_mplt'] = []
+    deps_mplt = _PathList()
     for c in classpath_deps.Direct('ohos_maple_jar2so'):
       if 'deps_mplt' not in c.keys():
           continue
-      deps_info['deps_mplt'].extend(sorted(m for m in c['deps_mplt']
-                                    if m not in deps_info['deps_mplt']))
+      deps_mplt.Extend(sorted(m for m in c['deps_mplt'] if m not in deps_mplt))
+    deps_info['deps_mplt'] = deps_mplt.paths
   deps_info['aosp_deps'] = []
   deps_info['external_deps'] = []
   if options.aosp_deps:
@@ -1257,19 +1424,19 @@ def main(argv):
   if is_java_target:
     # The classpath used to compile this target when annotation processors are
     # present.
-    javac_classpath = [
-        c['unprocessed_jar_path'] for c in direct_library_deps]
+    javac_classpath = _PathList(
+        [c['unprocessed_jar_path'] for c in direct_library_deps])
     # The classpath used to compile this target when annotation processors are
     # not present. These are also always used to know when a target needs to be
     # rebuilt.
-    javac_interface_classpath = [
-        c['interface_jar_path'] for c in direct_library_deps]
+    javac_interface_classpath = _PathList(
+        [c['interface_jar_path'] for c in direct_library_deps])
     # The classpath used for error prone.
-    javac_full_interface_classpath = [
-        c['interface_jar_path'] for c in all_library_deps]
+    javac_full_interface_classpath = _PathList(
+        [c['interface_jar_path'] for c in all_library_deps])
     # The classpath used for bytecode-rewritting.
-    javac_full_classpath = [
-        c['unprocessed_jar_path'] for c in all_library_deps]
+    javac_full_classpath = _PathList(
+        [c['unprocessed_jar_path'] for c in all_library_deps])
 
     # Deps to add to the compile-time classpath (but not the runtime classpath).
     javac_extra_jars = []
@@ -1298,24 +1465,21 @@ def main(argv):
         [c['jar_path'] for c in all_library_deps])
     deps_info['dex_deps_interface_jar_path'] = sorted(
         [c['interface_jar_path'] for c in all_library_deps])
-    javac_classpath.extend(javac_extra_jars)
-    javac_interface_classpath.extend(javac_extra_jars)
-    javac_full_interface_classpath.extend(
-        p for p in javac_extra_jars if p not in javac_full_classpath)
-    javac_full_classpath.extend(
-        p for p in javac_extra_jars if p not in javac_full_classpath)
+    javac_classpath.Extend(javac_extra_jars)
+    javac_interface_classpath.Extend(javac_extra_jars)
+    javac_full_interface_classpath.Extend(
+        [p for p in javac_extra_jars if p not in javac_full_classpath])
+    javac_full_classpath.ExtendMissing(javac_extra_jars)
 
   if is_java_target or options.type == 'aosp_app_bundle':
     # The classpath to use to run this target (or as an input to ProGuard).
-    java_full_classpath = []
+    java_full_classpath = _PathList()
     if is_java_target and options.jar_path:
-      java_full_classpath.append(options.jar_path)
-    java_full_classpath.extend(c['jar_path'] for c in all_library_deps)
+      java_full_classpath.Append(options.jar_path)
+    java_full_classpath.Extend(c['jar_path'] for c in all_library_deps)
     if options.type == 'aosp_app_bundle':
       for d in deps.Direct('aosp_app_bundle_module'):
-        java_full_classpath.extend(
-            c for c in d.get('java_runtime_classpath', [])
-            if c not in java_full_classpath)
+        java_full_classpath.ExtendMissing(d.get('java_runtime_classpath', []))
 
   system_jars = [c['jar_path'] for c in system_library_deps]
   system_interface_jars = [c['interface_jar_path'] for c in system_library_deps]
@@ -1331,23 +1495,18 @@ def main(argv):
 
   if options.type in ('aosp_app', 'dist_aar', 'dist_jar',
                       'aosp_app_bundle_module', 'aosp_app_bundle'):
-    all_configs = deps_info.get('proguard_configs', [])
-    extra_jars = list()
+    all_configs = _PathList(deps_info.get('proguard_configs', []))
+    extra_jars = _PathList()
     for c in all_library_deps:
-      all_configs.extend(
-          p for p in c.get('proguard_configs', []) if p not in all_configs)
-      extra_jars.extend(
-          p for p in c.get('extra_classpath_jars', []) if p not in extra_jars)
+      all_configs.ExtendMissing(c.get('proguard_configs', []))
+      extra_jars.ExtendMissing(c.get('extra_classpath_jars', []))
     if options.type == 'aosp_app_bundle':
       for c in deps.Direct('aosp_app_bundle_module'):
-        all_configs.extend(
-            p for p in c.get('proguard_configs', []) if p not in all_configs)
+        all_configs.ExtendMissing(c.get('proguard_configs', []))
     deps_info['proguard_all_configs'] = sorted(all_configs)
     if options.type == 'aosp_app_bundle':
       for d in deps.Direct('aosp_app_bundle_module'):
-        extra_jars.extend(
-            c for c in d.get('proguard_classpath_jars', [])
-            if c not in extra_jars)
+        extra_jars.ExtendMissing(d.get('proguard_classpath_jars', []))
     deps_info['proguard_classpath_jars'] = sorted(extra_jars)
 
     if options.type == 'aosp_app_bundle':
@@ -1391,10 +1550,8 @@ def main(argv):
       assert options.proguard_enabled, ('proguard must be enabled for '
           'instrumentation apps if it\'s enabled for the tested app.')
       # Mutating lists, so no need to explicitly re-assign to dict.
-      all_configs.extend(p for p in tested_app_config['proguard_all_configs']
-                         if p not in all_configs)
-      extra_jars.extend(p for p in tested_app_config['proguard_classpath_jars']
-                        if p not in extra_jars)
+      all_configs.ExtendMissing(tested_app_config['proguard_all_configs'])
+      extra_jars.ExtendMissing(tested_app_config['proguard_classpath_jars'])
       tested_app_config = GetDepConfig(options.tested_app_config)
       deps_info['proguard_under_test_mapping'] = (
           tested_app_config['proguard_mapping_path'])
@@ -1409,26 +1566,24 @@ def main(argv):
 
     # Add all tested classes to the test's classpath to ensure that the test's
     # java code is a superset of the tested app's java code
-    java_full_classpath.extend(
-        p for p in tested_app_config['java_runtime_classpath']
-        if p not in java_full_classpath)
+    java_full_classpath.ExtendMissing(
+        tested_app_config['java_runtime_classpath'])
     # Include in the classpath classes that are added directly to the app under
     # test (those that are not a part of a java_library).
-    javac_classpath.append(tested_app_config['unprocessed_jar_path'])
-    javac_full_classpath.append(tested_app_config['unprocessed_jar_path'])
-    javac_interface_classpath.append(tested_app_config['interface_jar_path'])
-    javac_full_interface_classpath.append(
+    javac_classpath.Append(tested_app_config['unprocessed_jar_path'])
+    javac_full_classpath.Append(tested_app_config['unprocessed_jar_path'])
+    javac_interface_classpath.Append(tested_app_config['interface_jar_path'])
+    javac_full_interface_classpath.Append(
         tested_app_config['interface_jar_path'])
-    javac_full_interface_classpath.extend(
-        p for p in tested_app_config['javac_full_interface_classpath']
-        if p not in javac_full_interface_classpath)
-    javac_full_classpath.extend(
-        p for p in tested_app_config['javac_full_classpath']
-        if p not in javac_full_classpath)
+    javac_full_interface_classpath.ExtendMissing(
+        tested_app_config['javac_full_interface_classpath'])
+    javac_full_classpath.ExtendMissing(
+        tested_app_config['javac_full_classpath'])
 
     # Exclude dex files from the test app that exist within the app under test.
     tested_app_library_deps = tested_app_deps.All('java_library')
-    tested_app_deps_dex_files = [c['dex_path'] for c in tested_app_library_deps]
+    tested_app_deps_dex_files = set(
+        c['dex_path'] for c in tested_app_library_deps)
     deps_dex_files = [
         p for p in deps_dex_files if p not in tested_app_deps_dex_files]
 
@@ -1441,8 +1596,8 @@ def main(argv):
 
   if is_java_target:
     config['javac']['bootclasspath'] = system_jars
-    config['javac']['classpath'] = javac_classpath
-    config['javac']['interface_classpath'] = javac_interface_classpath
+    config['javac']['classpath'] = javac_classpath.paths
+    config['javac']['interface_classpath'] = javac_interface_classpath.paths
     # Direct() will be of type 'java_annotation_processor'.
     config['javac']['processor_classpath'] = [
         c['jar_path'] for c in processor_deps.Direct() if c.get('jar_path')] + [
@@ -1522,9 +1677,9 @@ def main(argv):
     java_resources_jars = [d['java_resources_jar'] for d in all_library_deps
                            if 'java_resources_jar' in d]
     if options.tested_app_config:
-      tested_app_resource_jars = [d['java_resources_jar']
-                                  for d in tested_app_library_deps
-                                  if 'java_resources_jar' in d]
+      tested_app_resource_jars = set(d['java_resources_jar']
+                                     for d in tested_app_library_deps
+                                     if 'java_resources_jar' in d)
       java_resources_jars = [jar for jar in java_resources_jars
                              if jar not in tested_app_resource_jars]
     config['java_resources_jars'] = java_resources_jars
@@ -1532,7 +1687,13 @@ def main(argv):
   if options.java_resources_jar_path:
     deps_info['java_resources_jar'] = options.java_resources_jar_path
 
+  deps_info['closure'] = _CreateClosure(
+      options.build_config, options.type, deps_info['deps_configs'])
   build_utils.write_json(config, options.build_config, only_if_changed=True)
+  summary = {
+      k: v for k, v in deps_info.items() if k not in _TRANSITIVE_KEYS}
+  build_utils.write_json(summary, _SummaryPath(options.build_config),
+                         only_if_changed=True)
 
   if options.depfile:
     build_utils.write_depfile(options.depfile, options.build_config, all_inputs,
@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026 Huawei Device Co., Ltd.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmarks write_build_config.py on a synthetic dependency graph.
+
+The graph has --libraries java libraries, each depending on 1 to 8 earlier
+libraries, resources or assets, plus a tested app. Their build_configs carry
+transitive classpaths, closures and summaries, as write_build_config.py
+writes them. The graph is then used by a few target types:
+
+  wide:   300 direct library deps and a group.
+  narrow: 12 direct library deps.
+
+Example:
+  write_build_config_benchmark.py --libraries=5000 --deps=wide
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import write_build_config  # noqa: E402
+from util import build_utils  # noqa: E402
+
+_JAR_TYPES = ('java_library', 'ohos_maple_jar2so')
+
+
+def _ConfigPath(graph_dir, name):
+  return os.path.join(graph_dir, name + '.build_config')
+
+
+def _WriteConfig(deps_info):
+  with open(deps_info['path'], 'w') as f:
+    json.dump({'deps_info': deps_info}, f)
+
+
+def _TransitiveDeps(configs, paths):
+  seen = {}
+
+  def Visit(nodes):
+    for node in nodes:
+      if node not in seen:
+        Visit(configs[node]['deps_configs'])
+        seen[node] = True
+
+  Visit(paths)
+  return list(seen)
+
+
+def _GenerateGraph(graph_dir, num_libraries):
+  """Writes the synthetic graph to |graph_dir|.
+
+  Returns {'wide': [build_config], 'narrow': [build_config]}, the direct
+  deps of the benchmarked targets.
+  """
+  rand = random.Random(1)
+  others = []
+  for i in range(num_libraries // 20):
+    name = 'res%d' % i
+    others.append({
+        'type': 'aosp_resources',
+        'path': _ConfigPath(graph_dir, name),
+        'name': name,
+        'deps_configs': [],
+        'resources_zip': name + '.zip',
+        'resources_dirs': ['res/%d' % i] if i % 2 else [],
+        'srcjar': name + '.srcjar',
+        'package_name': 'org.res%d' % i,
+        'r_text': name + '.R.txt',
+        'manifest': name + '.xml',
+    })
+  for i in range(num_libraries // 50):
+    name = 'assets%d' % i
+    others.append({
+        'type': 'aosp_assets',
+        'path': _ConfigPath(graph_dir, name),
+        'name': name,
+        'deps_configs': [],
+        'assets': {
+            'sources': ['a/%d.pak' % i, 'a/x%d' % (i % 7)],
+            'treat_as_locale_paks': i % 3 == 0,
+            'disable_compression': i % 2 == 0,
+        },
+    })
+
+  jars = []
+  for i in range(num_libraries):
+    name = 'lib%d' % i
+    pool = jars + others
+    deps = rand.sample(pool, min(len(pool), rand.randint(1, 8)))
+    shared = 'shared%d' % (i % 40)
+    deps_info = {
+        'type': 'ohos_maple_jar2so' if i % 97 == 5 else 'java_library',
+        'path': _ConfigPath(graph_dir, name),
+        'name': name,
+        'deps_configs': sorted(d['path'] for d in deps),
+        'jar_path': name + '.jar',
+        'unprocessed_jar_path': name + '.javac.jar',
+        'interface_jar_path': name + '.ijar',
+        'dex_path': name + '.dex.jar',
+        'requires_aosp': True,
+        'supports_aosp': True,
+        'is_prebuilt': i % 10 == 0,
+        'gradle_treat_as_prebuilt': False,
+        'aosp_deps': [],
+        'external_deps': [],
+        'proguard_configs': [shared + '.flags', name + '.flags'],
+        'extra_classpath_jars': [shared + '.extra.jar'],
+        'java_sources_file': name + '.sources',
+        'owned_resources_dirs': [],
+        'owned_resources_zips': [],
+        'owned_resource_srcjars': [],
+        'deps_mplt': [shared + '.mplt', name + '.mplt'],
+    }
+    if i % 5 == 0:
+      deps_info['java_resources_jar'] = name + '.res.jar'
+    jars.append(deps_info)
+
+  # Real library configs carry their transitive classpaths, which dominate
+  # the cost of parsing them.
+  configs = dict((c['path'], c) for c in others + jars)
+  for deps_info in jars:
+    deps = [
+        configs[p] for p in _TransitiveDeps(configs, deps_info['deps_configs'])
+        if configs[p]['type'] in _JAR_TYPES
+    ]
+    deps_info['javac_full_classpath'] = sorted(
+        c['unprocessed_jar_path'] for c in deps)
+    deps_info['javac_full_interface_classpath'] = sorted(
+        c['interface_jar_path'] for c in deps)
+    deps_info['dex_deps_jar_path'] = sorted(c['jar_path'] for c in deps)
+    deps_info['dex_deps_interface_jar_path'] = sorted(
+        c['interface_jar_path'] for c in deps)
+
+  group = {
+      'type': 'group',
+      'path': _ConfigPath(graph_dir, 'group0'),
+      'name': 'group0',
+      'deps_configs': [c['path'] for c in jars[-300:-250]],
+  }
+  half = jars[:num_libraries // 2]
+  tested = {
+      'type': 'aosp_app',
+      'path': _ConfigPath(graph_dir, 'tested'),
+      'name': 'tested',
+      'deps_configs': [c['path'] for c in half[-50:]],
+      'proguard_enabled': True,
+      'package_name': 'org.tested',
+      'java_runtime_classpath': [c['jar_path'] for c in half],
+      'unprocessed_jar_path': 'tested.javac.jar',
+      'interface_jar_path': 'tested.ijar',
+      'javac_full_interface_classpath': [c['interface_jar_path'] for c in half],
+      'javac_full_classpath': [c['unprocessed_jar_path'] for c in half],
+      'proguard_all_configs': ['tested.flags', 'shared1.flags'],
+      'proguard_classpath_jars': ['tested.extra.jar'],
+      'proguard_mapping_path': 'tested.mapping',
+  }
+  for deps_info in others + jars + [group, tested]:
+    _WriteConfig(deps_info)
+
+  # Closures and summaries are written deps first, as the real build does.
+  all_paths = [c['path'] for c in others + jars + [group, tested]]
+  for path in build_utils.get_sorted_transitive_dependencies(
+      all_paths, lambda p: write_build_config.GetDepConfig(p)['deps_configs']):
+    deps_info = write_build_config.GetDepConfig(path)
+    deps_info['closure'] = write_build_config._CreateClosure(
+        path, deps_info['type'], deps_info['deps_configs'])
+    build_utils.write_json({'deps_info': deps_info}, path)
+    build_utils.write_json(
+        dict((k, v) for k, v in deps_info.items()
+             if k not in write_build_config._TRANSITIVE_KEYS),
+        write_build_config._SummaryPath(path))
+
+  with open(os.path.join(graph_dir, 'Manifest.xml'), 'w') as f:
+    f.write('<manifest '
+            'xmlns:android="http://schemas.android.com/apk/res/android" '
+            'package="org.test"><instrumentation '
+            'android:targetPackage="org.tested"/></manifest>')
+  return {
+      'wide': [c['path'] for c in jars[-300:]] + [group['path']],
+      'narrow': [c['path'] for c in jars[-12:]],
+  }
+
+
+def _TargetArgs(graph_dir, out_dir, deps):
+  """Returns {target name: write_build_config.py arguments}."""
+  jar_args = [
+      '--jar-path=o.jar',
+      '--unprocessed-jar-path=o.javac.jar',
+      '--interface-jar-path=o.ijar',
+  ]
+  common = ['--supports-aosp', '--requires-aosp']
+  return {
+      'app': [
+          '--type=aosp_app',
+          '--dex-path=o.dex',
+          '--final-dex-path=final.dex',
+          '--is_hap',
+          '--tested-app-config=' + _ConfigPath(graph_dir, 'tested'),
+          '--manifest=' + os.path.join(graph_dir, 'Manifest.xml'),
+          '--proguard-enabled',
+          '--proguard-configs=["own.flags","shared3.flags"]',
+          '--java-sources-file=' + os.path.join(out_dir, 'app.sources'),
+      ] + common + jar_args,
+      'lib': [
+          '--type=java_library',
+          '--classpath-deps-configs=' + json.dumps(deps[:30]),
+          '--extra-classpath-jars=["x.jar","lib1.javac.jar"]',
+      ] + common + jar_args,
+      'dist': ['--type=dist_jar', '--proguard-configs=["d.flags"]'] + common,
+      'bin': ['--type=java_binary'] + common + jar_args,
+  }
+
+
+def _ClearCaches():
+  write_build_config.dep_config_cache.clear()
+  write_build_config.dep_summary_cache.clear()
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__,
+                                   formatter_class=argparse.RawTextHelpFormatter)
+  parser.add_argument('--libraries', type=int, default=5000,
+                      help='Number of java libraries in the graph.')
+  parser.add_argument('--deps', choices=('wide', 'narrow'), default='wide',
+                      help='Direct deps of the benchmarked targets.')
+  parser.add_argument('--repeat', type=int, default=3,
+                      help='Runs per target; the fastest one is reported.')
+  parser.add_argument('--graph-dir',
+                      help='Where to write the graph. A temporary directory '
+                      'is used and removed when omitted.')
+  options = parser.parse_args()
+
+  work_dir = options.graph_dir or tempfile.mkdtemp()
+  try:
+    graph_dir = os.path.join(work_dir, 'graph')
+    out_dir = os.path.join(work_dir, 'out')
+    build_utils.make_directory(graph_dir)
+    build_utils.make_directory(out_dir)
+
+    start = time.time()
+    deps = _GenerateGraph(graph_dir, options.libraries)[options.deps]
+    print('graph: %d libraries in %.1fs' %
+          (options.libraries, time.time() - start))
+
+    total = 0
+    for name, args in sorted(_TargetArgs(graph_dir, out_dir, deps).items()):
+      args = args + [
+          '--deps-configs=' + json.dumps(deps),
+          '--build-config=' + os.path.join(out_dir, name + '.build_config'),
+      ]
+      best = None
+      for _ in range(options.repeat):
+        # Each action runs in a fresh process, without warm caches.
+        _ClearCaches()
+        start = time.time()
+        write_build_config.main(args)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+      total += best
+      print('%-5s %.3fs' % (name, best))
+    print('total %.3fs' % total)
+
+    _ClearCaches()
+    target_deps = write_build_config.Deps(deps)
+    types = _JAR_TYPES + ('aosp_resources', 'aosp_assets')
+    for config_type in types:
+      target_deps.All(config_type)
+    start = time.time()
+    for _ in range(50):
+      for config_type in types:
+        target_deps.All(config_type)
+        target_deps.Direct(config_type)
+    print('Deps: %d configs, %d All() and Direct() lookups in %.1fms' %
+          (len(target_deps.AllConfigPaths()), 50 * 2 * len(types),
+           (time.time() - start) * 1000))
+  finally:
+    if not options.graph_dir:
+      shutil.rmtree(work_dir)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())